@@ -0,0 +1,143 @@
+# --- MOODIARY 운영자용 일괄 분석 ---
+# 전체 diaries 데이터를 한 번에 컬럼형 DataFrame으로 올린 뒤, 사용자 루프 없이 groupby 벡터 연산으로 계산합니다.
+# 사용법:
+#   python moodiary_analytics.py                                   # 로컬 미러(SQLite)에서 읽어 analytics_out/ 에 parquet 저장
+#   python moodiary_analytics.py --source sheets --format csv      # 구글 시트 일기 워크시트(파티션 포함)에서 직접 읽기
+#   python moodiary_analytics.py --synthetic 1000000               # 가상 데이터 100만 행으로 성능 확인
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import moodiary_app as app
+from moodiary_app import EMOTION_META, LOCAL_DB_PATH
+
+EMOTIONS = list(EMOTION_META.keys())
+# 주간 기분 변화 계산용 감정 점수 (-1 부정 ~ +1 긍정)
+EMOTION_VALENCE = {"기쁨": 1.0, "중립": 0.0, "불안": -0.5, "힘듦": -0.5, "슬픔": -1.0, "분노": -1.0}
+
+
+# =========================================
+# 📥 데이터 적재
+# =========================================
+def _to_frame(records):
+    df = pd.DataFrame(records, columns=["username", "date", "emotion"])
+    df["username"] = df["username"].astype(str).astype("category")
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    df["emotion"] = pd.Categorical(df["emotion"], categories=EMOTIONS)
+    return df.dropna(subset=["date", "emotion"]).reset_index(drop=True)
+
+
+def load_local(path):
+    with sqlite3.connect(path) as conn:
+        return _to_frame(pd.read_sql_query("SELECT username, date, emotion FROM diaries", conn))
+
+
+def load_sheets():
+    sh = app.init_db()
+    if sh is None: raise SystemExit("DB 연결 실패 (.streamlit/secrets.toml 확인)")
+    records = []
+    # MOODIARY_PARTITIONING 에 맞는 일기 워크시트(diaries 또는 diaries_YYYY-MM / diaries_uNN)를 모두 읽음
+    for title in app.diary_partitions(sh, refresh=True):
+        values = app._sheet_values(app.get_worksheet(sh, title).get("A2:D"))
+        records.extend([u, d, e] for u, d, e, _ in values if u and d)
+    return _to_frame(records)
+
+
+def synthetic(n_rows, n_users=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(1, n_rows // 300)
+    users = rng.integers(0, n_users, n_rows)
+    days = rng.integers(0, 3 * 365, n_rows)
+    df = pd.DataFrame({"username": pd.Categorical.from_codes(users, [f"user{i}" for i in range(n_users)]),
+                       "date": pd.Timestamp("2023-01-01") + pd.to_timedelta(days, unit="D"),
+                       "emotion": pd.Categorical.from_codes(rng.integers(0, len(EMOTIONS), n_rows), EMOTIONS)})
+    # 앱과 같이 (사용자, 날짜)당 하나만 남김
+    return df.drop_duplicates(["username", "date"]).reset_index(drop=True)
+
+
+# =========================================
+# 📊 분석 (모두 groupby 벡터 연산)
+# =========================================
+def monthly_distribution(df):
+    month = df["date"].dt.to_period("M").astype(str).rename("month")
+    table = df.groupby([df["username"], month, df["emotion"]], observed=True).size().unstack("emotion", fill_value=0)
+    table = table.reindex(columns=EMOTIONS, fill_value=0)
+    table["total"] = table.sum(axis=1)
+    table["top_emotion"] = table[EMOTIONS].idxmax(axis=1)
+    return table.reset_index()
+
+
+def streaks(df):
+    d = df[["username", "date"]].sort_values(["username", "date"])
+    user = d["username"].astype(str)
+    # 사용자가 바뀌거나 하루 이상 비면 새 연속 기록 시작
+    new_run = (user != user.shift()) | (d["date"].diff() != pd.Timedelta(days=1))
+    runs = d.groupby(new_run.cumsum().to_numpy()).agg(username=("username", "first"), start=("date", "min"),
+                                                      end=("date", "max"), length=("date", "size"))
+    runs["username"] = runs["username"].astype(str)
+    per_user = runs.groupby("username").agg(longest_streak=("length", "max"), runs=("length", "size"),
+                                            last_date=("end", "max"))
+    last_runs = runs.loc[runs.groupby("username")["end"].idxmax(), ["username", "length"]].set_index("username")
+    per_user["last_streak"] = last_runs["length"]
+    return per_user.reset_index()
+
+
+def weekly_mood_shift(df):
+    valence = df["emotion"].map(EMOTION_VALENCE).astype(float)
+    week = df["date"].dt.to_period("W-SUN").dt.start_time.rename("week")
+    weekly = valence.groupby([df["username"], week], observed=True).agg(["mean", "size"]).reset_index()
+    weekly.columns = ["username", "week", "mood", "entries"]
+    weekly = weekly.sort_values(["username", "week"])
+    g = weekly.groupby("username", observed=True)
+    # 바로 이전 주와 비교 (기록이 빈 주가 끼면 변화량 없음)
+    consecutive = g["week"].diff() == pd.Timedelta(weeks=1)
+    weekly["wow_shift"] = g["mood"].diff().where(consecutive)
+    return weekly.reset_index(drop=True)
+
+
+def global_mix(df):
+    counts = df["emotion"].value_counts().reindex(EMOTIONS, fill_value=0)
+    return pd.DataFrame({"emotion": EMOTIONS, "count": counts.to_numpy(), "share": (counts / max(len(df), 1)).to_numpy()})
+
+
+REPORTS = {"monthly_distribution": monthly_distribution, "streaks": streaks,
+           "weekly_mood_shift": weekly_mood_shift, "global_mix": global_mix}
+
+
+def export(table, out_dir, name, fmt):
+    path = os.path.join(out_dir, f"{name}.{fmt}")
+    if fmt == "parquet": table.to_parquet(path, index=False)
+    else: table.to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MOODIARY 일괄 감정 분석")
+    parser.add_argument("--source", choices=["local", "sheets"], default="local")
+    parser.add_argument("--local-db", default=LOCAL_DB_PATH, help="로컬 미러 SQLite 경로")
+    parser.add_argument("--synthetic", type=int, default=0, help="지정 시 가상 데이터 N행으로 실행")
+    parser.add_argument("--out", default="analytics_out")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument("--reports", nargs="+", choices=list(REPORTS), default=list(REPORTS))
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.synthetic: df = synthetic(args.synthetic)
+    elif args.source == "sheets": df = load_sheets()
+    else: df = load_local(args.local_db)
+    print(f"적재: {len(df):,}행, 사용자 {df['username'].nunique():,}명 ({time.perf_counter() - t0:.2f}s)")
+
+    os.makedirs(args.out, exist_ok=True)
+    for name in args.reports:
+        t0 = time.perf_counter()
+        table = REPORTS[name](df)
+        path = export(table, args.out, name, args.format)
+        print(f"{name}: {len(table):,}행 → {path} ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,25 @@
 # --- 1) 필수 라이브러리 ---
 import streamlit as st
 import random
+import re
+import os
+import sqlite3
+import threading
+import time
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from types import SimpleNamespace
+import importlib.util
+import hashlib
+import functools
+import json
+import unicodedata
+import zlib
 import requests
-import torch
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+# torch / transformers 는 무거우므로 추론이 처음 필요할 때 import (콜드 스타트 단축)
 import streamlit.components.v1 as components
 from datetime import datetime, timezone, timedelta  # KST
 from streamlit_calendar import calendar
@@ -21,10 +37,76 @@ except ImportError:
     SpotifyClientCredentials = None
     SPOTIPY_AVAILABLE = False
 
+# (선택) ONNX Runtime 추론 백엔드 — 설치 여부만 확인하고 실제 import는 로드 시점에
+ORT_AVAILABLE = importlib.util.find_spec("onnxruntime") is not None
+
 # --- 2) 기본 설정 ---
 EMOTION_MODEL_ID = "JUDONGHYEOK/6-emotion-bert-korean-v6-balanced"
 TMDB_BASE_URL = "https://api.themoviedb.org/3"
 GSHEET_DB_NAME = "moodiary_db" 
+# 로컬 일기 저장소 (구글 시트 앞단 SQLite)
+LOCAL_DB_PATH = os.environ.get("MOODIARY_LOCAL_DB", "moodiary_local.db")
+# 사용자 인덱스 (시트 전체 대조 주기 / 모르는 아이디일 때 재조회 최소 간격, 초)
+USER_INDEX_TTL = 600
+USER_INDEX_MISS_REFRESH = 30
+# 사용자별 일기 캐시 (항목 유효 시간 / 최대 사용자 수)
+DIARY_CACHE_TTL = 300
+DIARY_CACHE_MAX_USERS = 2000
+# 행복 저장소 카드 페이지 크기 ('더 보기'마다 추가로 불러올 개수)
+HAPPY_PAGE_SIZE = 10
+# 시트 → 로컬 증분 동기화 (증분 확인 주기 / 전체 대조 주기, 초 / 끝부분 검증에 쓰는 행 수)
+SYNC_INTERVAL = int(os.environ.get("MOODIARY_SYNC_INTERVAL", "30"))
+SYNC_FULL_EVERY = int(os.environ.get("MOODIARY_SYNC_FULL_EVERY", str(6 * 3600)))
+SYNC_TAIL_ROWS = 5
+# 한 번도 동기화하지 않은 파티션을 백그라운드에서 채울 때 파티션 사이 대기 (초, 분당 읽기 할당량 대비)
+SYNC_BACKFILL_PAUSE = float(os.environ.get("MOODIARY_SYNC_BACKFILL_PAUSE", "1.0"))
+# 일기 워크시트 파티션 (none: diaries 하나 / month: 월별 diaries_YYYY-MM / user_hash: 사용자 해시별 diaries_uNN)
+DIARY_PARTITIONINGS = ("none", "month", "user_hash")
+DIARY_PARTITIONING = os.environ.get("MOODIARY_PARTITIONING", "none")
+DIARY_SHARDS = int(os.environ.get("MOODIARY_PARTITION_SHARDS", "16"))
+# 파티션 목록(worksheets 메타데이터) 재조회 주기, 초
+PARTITION_LIST_TTL = 300
+# 워크시트 핸들/헤더 레지스트리 유효 시간 (오류가 나면 즉시 다시 조회), 초
+WORKSHEET_HANDLE_TTL = int(os.environ.get("MOODIARY_WORKSHEET_HANDLE_TTL", str(6 * 3600)))
+# 저장 대기열(outbox) → 시트 반영 (한 번에 보낼 최대 건수 / 점검 주기 / 최대 재시도 간격, 초)
+OUTBOX_BATCH = 100
+OUTBOX_POLL_SECONDS = 2.0
+OUTBOX_BACKOFF_MAX = 300
+# 감정 분석 마이크로 배치 (최대 배치 크기 / 배치를 모으는 최대 대기 시간)
+INFER_MAX_BATCH = int(os.environ.get("MOODIARY_INFER_MAX_BATCH", "16"))
+INFER_MAX_WAIT_MS = float(os.environ.get("MOODIARY_INFER_MAX_WAIT_MS", "10"))
+# 긴 일기: 256토큰 창을 겹쳐 가며 나눠 추론 (mean / max / weighted 로 확률 결합)
+INFER_MAX_LENGTH = 256
+CHUNK_ENABLED = os.environ.get("MOODIARY_CHUNKING", "1") == "1"
+CHUNK_STRIDE = int(os.environ.get("MOODIARY_CHUNK_STRIDE", "64"))
+CHUNK_AGGREGATION = os.environ.get("MOODIARY_CHUNK_AGGREGATION", "weighted")
+CHUNK_MAX_CHUNKS = int(os.environ.get("MOODIARY_CHUNK_MAX_CHUNKS", "16"))
+INFER_LATENCY_BUDGET_MS = float(os.environ.get("MOODIARY_INFER_LATENCY_BUDGET_MS", "1500"))
+# 추론 백엔드: fp32 (기본) / int8 (torch 동적 양자화) / onnx (ONNX Runtime)
+INFERENCE_BACKENDS = ("fp32", "int8", "onnx")
+INFERENCE_BACKEND = os.environ.get("MOODIARY_INFERENCE_BACKEND", "fp32")
+ONNX_MODEL_PATH = os.environ.get("MOODIARY_ONNX_PATH", "moodiary_emotion.onnx")
+# (선택) 모델/토크나이저 디스크 캐시 폴더 — 비어 있으면 허브 기본 캐시만 사용
+MODEL_CACHE_DIR = os.environ.get("MOODIARY_MODEL_CACHE_DIR", "")
+# 감정 분석 결과 캐시 (정규화 텍스트 해시 + 모델 버전 키, LRU 크기 / 로컬 DB 영구 저장 여부)
+EMOTION_CACHE_SIZE = int(os.environ.get("MOODIARY_EMOTION_CACHE_SIZE", "2048"))
+EMOTION_CACHE_PERSIST = os.environ.get("MOODIARY_EMOTION_CACHE_PERSIST", "1") == "1"
+EMOTION_CACHE_DISK_MAX = 50000
+# 추천 후보 풀 (갱신 주기 초 / 감정별로 모을 플레이리스트 수 / 동시 요청 수)
+MUSIC_POOL_TTL = 1800
+MUSIC_POOL_PLAYLISTS = 12
+MOVIE_POOL_TTL = 3600
+MOVIE_POOL_PAGES = 5
+RECO_FETCH_WORKERS = 8
+# 성능 계측 (지연 시간 히스토그램 버킷 ms / 백분위 계산용 최근 샘플 수 / JSON lines 내보내기 경로·주기)
+METRICS_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+METRICS_SAMPLES = 2048
+METRICS_JSONL_PATH = os.environ.get("MOODIARY_METRICS_JSONL", "")
+METRICS_JSONL_INTERVAL = 60
+# 성능 패널을 볼 수 있는 관리자 아이디 (쉼표 구분)
+ADMIN_USERS = {u.strip() for u in os.environ.get("MOODIARY_ADMINS", "").split(",") if u.strip()}
+# 저장 파이프라인 단계별 제한 시간 (초) — 초과 시 부분 결과로 진행
+SAVE_STEP_TIMEOUTS = {"music": 5.0, "movies": 5.0, "save": 10.0}
 
 # 비상용 TMDB 키
 EMERGENCY_TMDB_KEY = "8587d6734fd278ecc05dcbe710c29f9c"
@@ -42,11 +124,169 @@ KST = timezone(timedelta(hours=9))
 
 st.set_page_config(layout="wide", page_title="MOODIARY", page_icon="💖")
 
-# ⭐️ 커스텀 CSS (야간 모드 CSS 조건부 렌더링 및 사이드바 수정)
+# =========================================
+# 📈 성능 계측 (핫패스별 지연 시간 / 호출 수 / 캐시 적중 / 오류)
+# =========================================
+@st.cache_resource
+def get_metrics():
+    return {"series": {}, "interactions": {}, "lock": threading.Lock(), "started": time.time()}
+
+def _metric_series(metrics, name):
+    series = metrics["series"].get(name)
+    if series is None:
+        series = {"count": 0, "errors": 0, "sum_ms": 0.0, "buckets": [0] * (len(METRICS_BUCKETS_MS) + 1),
+                  "samples": deque(maxlen=METRICS_SAMPLES), "hits": 0, "misses": 0, "last_error": None}
+        metrics["series"][name] = series
+    return series
+
+def record_latency(name, ms, failed=False):
+    metrics = get_metrics()
+    with metrics["lock"]:
+        series = _metric_series(metrics, name)
+        series["count"] += 1
+        series["errors"] += failed
+        series["sum_ms"] += ms
+        series["buckets"][sum(ms > b for b in METRICS_BUCKETS_MS)] += 1
+        series["samples"].append(ms)
+
+def record_cache(name, hit):
+    metrics = get_metrics()
+    with metrics["lock"]: _metric_series(metrics, name)["hits" if hit else "misses"] += 1
+
+# except 로 삼켜지는 오류도 개수와 마지막 메시지를 남김
+def record_error(name, exc):
+    metrics = get_metrics()
+    with metrics["lock"]:
+        series = _metric_series(metrics, name)
+        series["errors"] += 1
+        series["last_error"] = f"{type(exc).__name__}: {exc}"
+
+# 상호작용(버튼 클릭 등)당 스크립트 실행 횟수: 콜백이 클릭을, 실행 시작이 실행을 셈
+def record_interaction(name):
+    metrics = get_metrics()
+    with metrics["lock"]: metrics["interactions"].setdefault(name, {"clicks": 0, "runs": 0})["clicks"] += 1
+
+def record_script_run(name):
+    metrics = get_metrics()
+    with metrics["lock"]: metrics["interactions"].setdefault(name or "(위젯/첫 실행)", {"clicks": 0, "runs": 0})["runs"] += 1
+
+def interaction_stats():
+    metrics = get_metrics()
+    with metrics["lock"]:
+        return {name: {**c, "runs_per_click": c["runs"] / c["clicks"] if c["clicks"] else None}
+                for name, c in sorted(metrics["interactions"].items())}
+
+def instrument(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0, failed = time.perf_counter(), False
+            try: return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally: record_latency(name, (time.perf_counter() - t0) * 1000, failed)
+        return wrapper
+    return decorator
+
+def _percentile(sorted_samples, q):
+    if not sorted_samples: return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+def metrics_snapshot():
+    metrics = get_metrics()
+    with metrics["lock"]:
+        items = [(name, dict(series, samples=sorted(series["samples"]))) for name, series in metrics["series"].items()]
+    snapshot = {}
+    for name, series in sorted(items):
+        lookups = series["hits"] + series["misses"]
+        snapshot[name] = {
+            "count": series["count"], "errors": series["errors"],
+            "p50_ms": _percentile(series["samples"], 0.50), "p95_ms": _percentile(series["samples"], 0.95),
+            "p99_ms": _percentile(series["samples"], 0.99),
+            "cache_hits": series["hits"], "cache_misses": series["misses"],
+            "hit_rate": series["hits"] / lookups if lookups else None, "last_error": series["last_error"],
+        }
+    return snapshot
+
+def metrics_prometheus():
+    metrics = get_metrics()
+    with metrics["lock"]:
+        items = sorted((name, dict(series)) for name, series in metrics["series"].items())
+    lines = ["# TYPE moodiary_latency_ms histogram"]
+    for name, series in items:
+        if not series["count"]: continue
+        cumulative = 0
+        for bound, n in zip(list(METRICS_BUCKETS_MS) + ["+Inf"], series["buckets"]):
+            cumulative += n
+            lines.append(f'moodiary_latency_ms_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'moodiary_latency_ms_sum{{op="{name}"}} {series["sum_ms"]:.3f}')
+        lines.append(f'moodiary_latency_ms_count{{op="{name}"}} {series["count"]}')
+    for metric, field in (("moodiary_errors_total", "errors"), ("moodiary_cache_hits_total", "hits"), ("moodiary_cache_misses_total", "misses")):
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{op="{name}"}} {series[field]}' for name, series in items)
+    interactions = interaction_stats()
+    for metric, field in (("moodiary_interaction_clicks_total", "clicks"), ("moodiary_script_runs_total", "runs")):
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{interaction="{name}"}} {c[field]}' for name, c in interactions.items())
+    return "\n".join(lines) + "\n"
+
+def metrics_jsonl_line():
+    return json.dumps({"ts": time.time(), "metrics": metrics_snapshot(), "interactions": interaction_stats()}, ensure_ascii=False)
+
+# MOODIARY_METRICS_JSONL 이 지정되면 주기적으로 스냅샷을 한 줄씩 추가
+@st.cache_resource
+def start_metrics_exporter():
+    if not METRICS_JSONL_PATH: return False
+    def loop():
+        while True:
+            time.sleep(METRICS_JSONL_INTERVAL)
+            try:
+                with open(METRICS_JSONL_PATH, "a", encoding="utf-8") as f: f.write(metrics_jsonl_line() + "\n")
+            except OSError: pass
+    threading.Thread(target=loop, daemon=True, name="moodiary-metrics").start()
+    return True
+
+# =========================================
+# 🧩 렌더링 조각 캐시 (CSS / 통계 요약·차트 스펙 / 행복 카드)
+# =========================================
+# (종류, 테마, 데이터 버전) 키로 만들어 둔 HTML·CSS·차트 스펙을 재사용. 데이터 버전은 store_month_version
+FRAGMENT_CACHE_MAX = 4096
+
+# st.fragment: 조각 안의 위젯은 그 조각만 다시 실행 (구버전은 experimental_fragment, 없으면 전체 실행)
+st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda fn: fn)
+
+@st.cache_resource
+def get_fragment_cache():
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+def cached_fragment(kind, key, build):
+    cache, key = get_fragment_cache(), (kind, key)
+    with cache["lock"]:
+        hit = cache["entries"].get(key)
+        if hit is not None:
+            cache["entries"].move_to_end(key)
+            record_cache(f"fragment_{kind}", True)
+            return hit
+    record_cache(f"fragment_{kind}", False)
+    value = build()
+    with cache["lock"]:
+        cache["entries"][key] = value
+        while len(cache["entries"]) > FRAGMENT_CACHE_MAX: cache["entries"].popitem(last=False)
+    return value
+
+# 조각 안의 위젯 클릭은 전체 실행 없이 그 조각만 실행되므로, 조각 첫머리에서 상호작용 실행으로 셈
+# (전체 실행이면 메인에서 이미 꺼내 셌으므로 아무것도 하지 않음)
+def record_fragment_run():
+    name = st.session_state.pop("interaction", None)
+    if name: record_script_run(name)
+
+# ⭐️ 커스텀 CSS (야간 모드 CSS 조건부 렌더링 및 사이드바 수정) — 테마별로 한 번만 만들어 둠
 def apply_custom_css():
-    
     is_dark = st.session_state.get("dark_mode", False)
-    
+    st.markdown(cached_fragment("css", is_dark, lambda: build_custom_css(is_dark)), unsafe_allow_html=True)
+
+def build_custom_css(is_dark):
     if is_dark:
         # 야간 모드 색상
         bg_start = "#121212"
@@ -169,7 +409,7 @@ def apply_custom_css():
         footer {{visibility: hidden;}}
         </style>
     """
-    st.markdown(css, unsafe_allow_html=True)
+    return css
 
 # =========================================
 # 🔐 3) 구글 시트 데이터베이스
@@ -182,6 +422,7 @@ def get_gsheets_client():
         credentials = Credentials.from_service_account_info(creds, scopes=scope)
         return gspread.authorize(credentials)
     except Exception as e:
+        record_error("gsheets_client", e)
         return None
 
 @st.cache_resource(ttl=3600)
@@ -190,78 +431,942 @@ def init_db():
     if not client: return None
     try:
         sh = client.open(GSHEET_DB_NAME)
-        sh.worksheet("users")
-        sh.worksheet("diaries")
+        get_worksheet(sh, "users")  # 레지스트리가 유효하면 추가 요청 없음 (diaries 파티션은 첫 저장 때 자동 생성)
         return sh
     except Exception as e:
+        record_error("init_db", e)
         st.error(f"❌ DB 연결 실패: 시트 이름/공유 권한 확인 필요. (에러 유형: {type(e).__name__})")
         return None 
 
-def get_all_users(sh):
-    if not sh: return {}
-    try:
-        rows = sh.worksheet("users").get_all_records()
-        return {str(row['username']): str(row['password']) for row in rows}
-    except: return {}
+# ⭐️ 워크시트 핸들 레지스트리: sh.worksheet(...)는 호출마다 스프레드시트 메타데이터를 새로 받아 오므로,
+# worksheets() 한 번으로 모든 핸들을 받아 프로세스에 두고 긴 TTL 또는 오류 시에만 다시 조회
+@st.cache_resource
+def get_worksheet_registry():
+    return {"handles": {}, "columns": {}, "loaded_at": None, "lock": threading.Lock(), "metadata_fetches": 0, "round_trips_saved": 0}
+
+def _load_worksheet_handles(sh, registry):
+    registry["handles"] = {ws.title: ws for ws in sh.worksheets()}
+    registry["loaded_at"] = time.monotonic()
+    registry["metadata_fetches"] += 1
+
+# max_age: 목록 자체가 필요할 때(파티션 탐색) 더 짧게 줄 수 있음
+def worksheet_titles(sh, max_age=WORKSHEET_HANDLE_TTL):
+    registry = get_worksheet_registry()
+    with registry["lock"]:
+        if registry["loaded_at"] is None or time.monotonic() - registry["loaded_at"] > max_age: _load_worksheet_handles(sh, registry)
+        return list(registry["handles"])
+
+def get_worksheet(sh, title):
+    registry = get_worksheet_registry()
+    with registry["lock"]:
+        fresh = registry["loaded_at"] is not None and time.monotonic() - registry["loaded_at"] < WORKSHEET_HANDLE_TTL
+        ws = registry["handles"].get(title) if fresh else None
+        if ws is not None:
+            registry["round_trips_saved"] += 1
+            record_cache("worksheet_handle", True)
+            return ws
+        # 처음이거나 만료, 또는 다른 인스턴스가 방금 만든 워크시트일 수 있으므로 다시 조회
+        record_cache("worksheet_handle", False)
+        _load_worksheet_handles(sh, registry)
+        ws = registry["handles"].get(title)
+    if ws is None: raise gspread.exceptions.WorksheetNotFound(title)
+    return ws
+
+def register_worksheet(ws, columns=None):
+    registry = get_worksheet_registry()
+    with registry["lock"]:
+        registry["handles"][ws.title] = ws
+        if columns: registry["columns"][ws.title] = {name: chr(65 + i) for i, name in enumerate(columns)}
+
+# 시트 요청이 실패하면 (삭제/이름 변경된 워크시트 등) 다음 호출에서 핸들과 헤더를 새로 받도록
+def invalidate_worksheets():
+    registry = get_worksheet_registry()
+    with registry["lock"]: registry["loaded_at"], registry["columns"] = None, {}
+
+# 헤더 이름 → 열 문자 (워크시트당 1회 조회)
+def worksheet_columns(sh, title):
+    registry = get_worksheet_registry()
+    with registry["lock"]: columns = registry["columns"].get(title)
+    if columns is None:
+        header = get_worksheet(sh, title).row_values(1)
+        columns = {name: chr(65 + i) for i, name in enumerate(header)}
+        with registry["lock"]: registry["columns"][title] = columns
+    return columns
+
+def worksheet_registry_stats():
+    registry = get_worksheet_registry()
+    with registry["lock"]:
+        return {"worksheets": len(registry["handles"]), "metadata_fetches": registry["metadata_fetches"],
+                "round_trips_saved": registry["round_trips_saved"]}
+
+# ⭐️ 사용자 인덱스: username → password 해시맵을 프로세스에 두고 TTL마다 시트와 대조
+@st.cache_resource
+def get_user_index():
+    return {"users": {}, "loaded_at": None, "lock": threading.Lock(), "refresh_lock": threading.Lock(), "refreshes": 0}
+
+def _refresh_user_index(sh, max_age):
+    idx = get_user_index()
+    # 동시에 몰린 로그인 요청 중 한 스레드만 시트를 읽음
+    with idx["refresh_lock"]:
+        if idx["loaded_at"] is not None and time.monotonic() - idx["loaded_at"] < max_age: return
+        try: rows = get_worksheet(sh, "users").get_all_records()
+        except Exception as e:
+            record_error("user_index", e)
+            invalidate_worksheets()
+            return
+        users = {str(row['username']): str(row['password']) for row in rows}
+        with idx["lock"]:
+            idx["users"], idx["loaded_at"] = users, time.monotonic()
+            idx["refreshes"] += 1
+
+@instrument("lookup_user")
+def lookup_user(sh, username):
+    if not sh: return None
+    idx = get_user_index()
+    _refresh_user_index(sh, USER_INDEX_TTL)
+    with idx["lock"]: password = idx["users"].get(str(username))
+    record_cache("lookup_user", password is not None)
+    # 다른 인스턴스에서 방금 가입한 계정일 수 있으므로 모르는 아이디면 (간격을 두고) 한 번 더 확인
+    if password is None:
+        _refresh_user_index(sh, USER_INDEX_MISS_REFRESH)
+        with idx["lock"]: password = idx["users"].get(str(username))
+    return password
 
 def add_user(sh, username, password):
     if not sh: return False
     try:
-        sh.worksheet("users").append_row([str(username), str(password)])
+        get_worksheet(sh, "users").append_row([str(username), str(password)])
+    except Exception as e:
+        record_error("add_user", e)
+        invalidate_worksheets()
+        return False
+    idx = get_user_index()
+    with idx["lock"]: idx["users"][str(username)] = str(password)
+    return True
+
+# =========================================
+# 🗄️ 로컬 일기 저장소 (SQLite, 시트 앞단 write-through)
+# =========================================
+# 읽기는 (username, date) 키의 로컬 테이블에서 사용자 행만 조회하고,
+# 시트에서는 지난 동기화 이후 추가된 행만 읽어 옵니다 (전체 대조는 주기적으로만).
+@st.cache_resource
+def get_local_store():
+    conn = sqlite3.connect(LOCAL_DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS diaries (
+            username TEXT NOT NULL,
+            date TEXT NOT NULL,
+            emotion TEXT,
+            text TEXT,
+            sheet_row INTEGER,
+            PRIMARY KEY (username, date)
+        )""")
+    # 이전 버전 로컬 DB에는 sheet_row 컬럼이 없음
+    if "sheet_row" not in [c[1] for c in conn.execute("PRAGMA table_info(diaries)")]:
+        conn.execute("ALTER TABLE diaries ADD COLUMN sheet_row INTEGER")
+    # ⭐️ 사용자별 감정 → 날짜 보조 인덱스 (행복 저장소 등 감정별 조회용, 저장 시 자동 유지)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_diaries_user_emotion_date ON diaries (username, emotion, date)")
+    # ⭐️ (사용자, 연-월) → 감정별 개수 집계. diaries 변경 시 트리거로 증분 갱신
+    has_monthly = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emotion_monthly'").fetchone()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS emotion_monthly (
+            username TEXT NOT NULL,
+            ym TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, ym, emotion)
+        );
+        CREATE TRIGGER IF NOT EXISTS diaries_monthly_insert AFTER INSERT ON diaries BEGIN
+            INSERT INTO emotion_monthly (username, ym, emotion, count) VALUES (NEW.username, substr(NEW.date, 1, 7), NEW.emotion, 1)
+            ON CONFLICT(username, ym, emotion) DO UPDATE SET count = count + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diaries_monthly_update AFTER UPDATE OF emotion, date ON diaries
+        WHEN OLD.emotion IS NOT NEW.emotion OR OLD.date IS NOT NEW.date BEGIN
+            UPDATE emotion_monthly SET count = count - 1
+            WHERE username = OLD.username AND ym = substr(OLD.date, 1, 7) AND emotion = OLD.emotion;
+            INSERT INTO emotion_monthly (username, ym, emotion, count) VALUES (NEW.username, substr(NEW.date, 1, 7), NEW.emotion, 1)
+            ON CONFLICT(username, ym, emotion) DO UPDATE SET count = count + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diaries_monthly_delete AFTER DELETE ON diaries BEGIN
+            UPDATE emotion_monthly SET count = count - 1
+            WHERE username = OLD.username AND ym = substr(OLD.date, 1, 7) AND emotion = OLD.emotion;
+        END;
+    """)
+    # 집계 테이블이 없던 이전 로컬 DB는 한 번만 전체 집계로 채움
+    if not has_monthly:
+        conn.execute("INSERT INTO emotion_monthly (username, ym, emotion, count) "
+                     "SELECT username, substr(date, 1, 7), emotion, COUNT(*) FROM diaries "
+                     "WHERE emotion IS NOT NULL GROUP BY username, substr(date, 1, 7), emotion")
+    # ⭐️ (사용자, 연-월) → 변경 횟수. 화면 조각 캐시의 데이터 버전으로, 다른 프로세스(재채점 등)의 쓰기도 트리거로 반영
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS diary_versions (
+            username TEXT NOT NULL,
+            ym TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, ym)
+        );
+        CREATE TRIGGER IF NOT EXISTS diaries_version_insert AFTER INSERT ON diaries BEGIN
+            INSERT INTO diary_versions (username, ym, version) VALUES (NEW.username, substr(NEW.date, 1, 7), 1)
+            ON CONFLICT(username, ym) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diaries_version_update AFTER UPDATE OF emotion, text, date ON diaries
+        WHEN OLD.emotion IS NOT NEW.emotion OR OLD.text IS NOT NEW.text OR OLD.date IS NOT NEW.date BEGIN
+            INSERT INTO diary_versions (username, ym, version) VALUES (OLD.username, substr(OLD.date, 1, 7), 1)
+            ON CONFLICT(username, ym) DO UPDATE SET version = version + 1;
+            INSERT INTO diary_versions (username, ym, version) VALUES (NEW.username, substr(NEW.date, 1, 7), 1)
+            ON CONFLICT(username, ym) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diaries_version_delete AFTER DELETE ON diaries BEGIN
+            INSERT INTO diary_versions (username, ym, version) VALUES (OLD.username, substr(OLD.date, 1, 7), 1)
+            ON CONFLICT(username, ym) DO UPDATE SET version = version + 1;
+        END;
+    """)
+    # 시트에 아직 반영되지 않은 저장 (같은 사용자/날짜의 재저장은 한 건으로 합쳐짐)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            username TEXT NOT NULL,
+            date TEXT NOT NULL,
+            emotion TEXT,
+            text TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            queued_at REAL,
+            PRIMARY KEY (username, date)
+        )""")
+    # 동기화 상태 (시트 high-water mark 등)
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS emotion_cache (
+            key TEXT PRIMARY KEY,
+            label TEXT,
+            score REAL,
+            used_at REAL
+        )""")
+    conn.commit()
+    return {"conn": conn, "lock": threading.Lock()}
+
+def store_month_version(username, ym):
+    store = get_local_store()
+    with store["lock"]:
+        row = store["conn"].execute(
+            "SELECT version FROM diary_versions WHERE username = ? AND ym = ?", (str(username), ym)).fetchone()
+    return row[0] if row else 0
+
+UPSERT_DIARY_SQL = (
+    "INSERT INTO diaries (username, date, emotion, text, sheet_row) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(username, date) DO UPDATE SET emotion = excluded.emotion, text = excluded.text, "
+    "sheet_row = COALESCE(excluded.sheet_row, diaries.sheet_row)")
+
+# 시트에서 읽은 행 반영: 저장 대기 중(outbox)인 항목은 같은 트랜잭션 안에서 확인해 행 번호만 갱신
+# (대기 목록을 따로 읽고 나서 쓰면, 그 사이 들어온 저장을 예전 시트 값으로 덮어쓸 수 있음)
+PENDING_SQL = "EXISTS (SELECT 1 FROM outbox WHERE outbox.username = diaries.username AND outbox.date = diaries.date)"
+APPLY_SHEET_ROW_SQL = (
+    "INSERT INTO diaries (username, date, emotion, text, sheet_row) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(username, date) DO UPDATE SET emotion = excluded.emotion, text = excluded.text, "
+    f"sheet_row = COALESCE(excluded.sheet_row, diaries.sheet_row) WHERE NOT {PENDING_SQL}")
+APPLY_PENDING_ROW_SQL = f"UPDATE diaries SET sheet_row = ? WHERE username = ? AND date = ? AND {PENDING_SQL}"
+
+# rows: (username, date, emotion, text, sheet_row)
+def store_apply_sheet_rows(rows):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.executemany(APPLY_SHEET_ROW_SQL, [(str(u), str(d), e, t, r) for u, d, e, t, r in rows])
+        conn.executemany(APPLY_PENDING_ROW_SQL, [(r, str(u), str(d)) for u, d, _, _, r in rows])
+
+# (username, date) → 시트 행 번호 인덱스 조회
+def store_get_sheet_row(username, date):
+    store = get_local_store()
+    with store["lock"]:
+        row = store["conn"].execute(
+            "SELECT sheet_row FROM diaries WHERE username = ? AND date = ?", (str(username), str(date))).fetchone()
+    return row[0] if row else None
+
+def store_get_user_diaries(username):
+    store = get_local_store()
+    with store["lock"]:
+        rows = store["conn"].execute(
+            "SELECT date, emotion, text FROM diaries WHERE username = ?", (str(username),)).fetchall()
+    return {d: {"emotion": e, "text": t} for d, e, t in rows}
+
+# 기간 조회: (username, date) 기본키 인덱스 범위 검색
+def store_get_diaries_between(username, start, end):
+    store = get_local_store()
+    with store["lock"]:
+        rows = store["conn"].execute(
+            "SELECT date, emotion, text FROM diaries WHERE username = ? AND date BETWEEN ? AND ?",
+            (str(username), str(start), str(end))).fetchall()
+    return {d: {"emotion": e, "text": t} for d, e, t in rows}
+
+def store_get_diary(username, date):
+    return store_get_diaries_between(username, date, date).get(str(date))
+
+# period: "YYYY-MM" (월) / "YYYY" (연) / "" (전체) — 집계 테이블만 읽음
+def store_emotion_counts(username, period=""):
+    store = get_local_store()
+    with store["lock"]:
+        rows = store["conn"].execute(
+            "SELECT emotion, SUM(count) FROM emotion_monthly WHERE username = ? AND ym LIKE ? GROUP BY emotion",
+            (str(username), f"{period}%")).fetchall()
+    return {e: int(c) for e, c in rows if e in EMOTION_META and c > 0}
+
+# 해당 감정이 기록된 월 목록 (최신순, 집계 테이블 사용)
+def store_emotion_months(username, emotion):
+    store = get_local_store()
+    with store["lock"]:
+        rows = store["conn"].execute(
+            "SELECT ym FROM emotion_monthly WHERE username = ? AND emotion = ? AND count > 0 ORDER BY ym DESC",
+            (str(username), emotion)).fetchall()
+    return [r[0] for r in rows]
+
+# 커서 기반 페이지 조회: before 날짜보다 이전 항목을 최신순으로 limit개 (감정 인덱스 사용)
+def store_emotion_page(username, emotion, ym, before=None, limit=HAPPY_PAGE_SIZE):
+    store = get_local_store()
+    with store["lock"]:
+        return store["conn"].execute(
+            "SELECT date, text FROM diaries WHERE username = ? AND emotion = ? AND date >= ? AND date < ? "
+            "ORDER BY date DESC LIMIT ?",
+            (str(username), emotion, f"{ym}-00", before or f"{ym}-99", limit)).fetchall()
+
+def store_set_sheet_rows(rows):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.executemany("UPDATE diaries SET sheet_row = ? WHERE username = ? AND date = ?",
+                         [(r, str(u), str(d)) for r, u, d in rows])
+
+# rows: (username, date, emotion) — 감정 값만 갱신 (본문/행 번호는 그대로)
+def store_set_emotions(rows):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.executemany("UPDATE diaries SET emotion = ? WHERE username = ? AND date = ?",
+                         [(e, str(u), str(d)) for u, d, e in rows])
+
+def store_delete_diaries(keys):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.executemany("DELETE FROM diaries WHERE username = ? AND date = ?", [(str(u), str(d)) for u, d in keys])
+
+# 전체 대조용: 파티션에 속한 (username, date) → (emotion, text, sheet_row)
+def store_get_sheet_index(title):
+    store = get_local_store()
+    with store["lock"]:
+        if DIARY_PARTITIONING == "month":
+            rows = store["conn"].execute("SELECT username, date, emotion, text, sheet_row FROM diaries WHERE substr(date, 1, 7) = ?",
+                                         (title.removeprefix("diaries_"),)).fetchall()
+        else: rows = store["conn"].execute("SELECT username, date, emotion, text, sheet_row FROM diaries").fetchall()
+    return {(u, d): ("" if e is None else str(e), "" if t is None else str(t), r)
+            for u, d, e, t, r in rows if diary_partition(u, d) == title}
+
+def store_get_meta(keys):
+    store = get_local_store()
+    with store["lock"]:
+        rows = dict(store["conn"].execute(
+            f"SELECT key, value FROM sync_meta WHERE key IN ({','.join('?' * len(keys))})", keys).fetchall())
+    return [rows.get(k) for k in keys]
+
+def store_set_meta(items):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.executemany("INSERT INTO sync_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                         [(k, str(v)) for k, v in items.items()])
+
+# =========================================
+# 🗂️ 일기 워크시트 파티션
+# =========================================
+# 시트가 커질수록 읽기/쓰기가 느려지므로 월별 또는 사용자 해시별 워크시트로 나눌 수 있습니다.
+# 로컬 미러는 하나이고, sheet_row 는 (username, date) 가 속한 파티션 안에서의 행 번호입니다.
+DIARY_HEADER = ["username", "date", "emotion", "text"]
+DIARY_PARTITION_PATTERNS = {"none": r"diaries", "month": r"diaries_\d{4}-\d{2}", "user_hash": r"diaries_u\d{2}"}
+
+def diary_partition(username, date, mode=None):
+    mode = mode or DIARY_PARTITIONING
+    if mode == "month": return f"diaries_{str(date)[:7]}"
+    if mode == "user_hash": return f"diaries_u{zlib.crc32(str(username).encode('utf-8')) % DIARY_SHARDS:02d}"
+    return "diaries"
+
+def is_diary_partition(title, mode=None):
+    return re.fullmatch(DIARY_PARTITION_PATTERNS[mode or DIARY_PARTITIONING], title) is not None
+
+# 존재하는 파티션 목록 (다른 인스턴스가 만든 파티션도 보이도록 레지스트리를 PARTITION_LIST_TTL 마다 갱신)
+def diary_partitions(sh, refresh=False):
+    if DIARY_PARTITIONING == "none": return ["diaries"]
+    return sorted(t for t in worksheet_titles(sh, 0 if refresh else PARTITION_LIST_TTL) if is_diary_partition(t))
+
+# 요청에 필요한 파티션만 (user_hash: 사용자의 샤드 / month: 보려는 달들, 없으면 이번 달만 / 그 외: 전체)
+# month 방식에서 달을 지정하지 않은 요청이 모든 월 워크시트를 차례로 읽지 않도록 이번 달로 제한
+def diary_partitions_for(sh, username=None, months=None):
+    if DIARY_PARTITIONING == "none": return ["diaries"]
+    existing = diary_partitions(sh)
+    if DIARY_PARTITIONING == "user_hash" and username is not None: wanted = {diary_partition(username, "")}
+    elif DIARY_PARTITIONING == "month": wanted = {diary_partition("", f"{m}-01") for m in months or [datetime.now(KST).strftime("%Y-%m")]}
+    else: return existing
+    return [t for t in existing if t in wanted]
+
+def get_diary_worksheet(sh, title, create=False):
+    try: return get_worksheet(sh, title)
+    except gspread.exceptions.WorksheetNotFound:
+        if not create: raise
+    ws = sh.add_worksheet(title=title, rows=1000, cols=len(DIARY_HEADER))
+    ws.append_row(DIARY_HEADER)
+    register_worksheet(ws, DIARY_HEADER)
+    return ws
+
+# 파티션 방식이 바뀌었으면(이전 후 재시작) 행 번호와 동기화 기준을 버리고 파티션별 전체 대조부터 다시
+def _check_partition_layout():
+    layout = f"user_hash:{DIARY_SHARDS}" if DIARY_PARTITIONING == "user_hash" else DIARY_PARTITIONING
+    stored, = store_get_meta(["partition_layout"])
+    if (stored or "none") != layout:
+        store = get_local_store()
+        with store["lock"], store["conn"] as conn:
+            conn.execute("UPDATE diaries SET sheet_row = NULL")
+            conn.execute("DELETE FROM sync_meta")
+    if stored != layout: store_set_meta({"partition_layout": layout})
+
+# =========================================
+# 🔄 시트 → 로컬 증분 동기화
+# =========================================
+# 시트는 거의 append-only 이므로 파티션마다 마지막으로 본 행 번호(high-water mark)와 끝부분 몇 행의 (username, date) 체크섬을 저장해 두고
+# 평소에는 "끝부분 + 그 이후" 범위만 읽습니다. 끝부분이 달라졌으면(행 삭제/정렬) 바로, 아니면 주기적으로 전체 대조합니다.
+# (제자리 수정(update_cell)은 행 수가 그대로라 증분으로는 보이지 않으므로 전체 대조에서 반영)
+@st.cache_resource
+def get_sync_state():
+    return {"lock": threading.Lock(), "synced_at": {}, "layout_checked": False, "delta_syncs": 0, "full_syncs": 0, "rows_fetched": 0, "last_error": None}
+
+def _sheet_values(values):
+    return [[str(c) for c in (list(v) + [""] * 4)[:4]] for v in values]
+
+def _tail_checksum(values):
+    return hashlib.sha1(json.dumps([v[:2] for v in values], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+# rows: (username, date, emotion, text, sheet_row). 저장 대기 중인 항목은 행 번호만 갱신
+def _apply_sheet_rows(rows):
+    rows = [r for r in rows if r[0] and r[1]]
+    store_apply_sheet_rows(rows)
+    diary_cache_invalidate({u for u, _, _, _, _ in rows})
+
+def _full_reconcile(ws):
+    values = _sheet_values(ws.get("A2:D"))
+    local, pending = store_get_sheet_index(ws.title), {(u, d) for u, d, _, _, _ in outbox_peek(None)}
+    rows = [(u, d, e, t, i + 2) for i, (u, d, e, t) in enumerate(values)]
+    seen = {(u, d) for u, d, _, _, _ in rows}
+    changed = [r for r in rows if local.get((r[0], r[1])) != (r[2], r[3], r[4])]
+    # 시트에서 지워진 행 (저장 대기 중이 아니면 로컬에서도 삭제)
+    removed = [k for k, (_, _, row) in local.items() if row is not None and k not in seen and k not in pending]
+    if removed:
+        store_delete_diaries(removed)
+        diary_cache_invalidate({u for u, _ in removed})
+    _apply_sheet_rows(changed)
+    cache = get_diary_cache()
+    with cache["lock"]: cache["sheet_fetches"] += 1
+    return len(values) + 1, _tail_checksum(values[-SYNC_TAIL_ROWS:]), len(values)
+
+# 끝부분이 예전과 같으면 (마지막 행 번호, 체크섬, 읽은 행 수), 다르면 None
+def _delta_sync(ws, last_row, tail):
+    start = max(2, last_row - SYNC_TAIL_ROWS + 1)
+    values = _sheet_values(ws.get(f"A{start}:D"))
+    known, new = values[:last_row - start + 1], values[last_row - start + 1:]
+    if len(known) != last_row - start + 1 or _tail_checksum(known) != tail: return None
+    _apply_sheet_rows([(u, d, e, t, last_row + 1 + i) for i, (u, d, e, t) in enumerate(new)])
+    return last_row + len(new), _tail_checksum((known + new)[-SYNC_TAIL_ROWS:]), len(values)
+
+# 파티션 하나를 동기화. 실패 시 예외를 그대로 올림 (max_age 안에 이미 동기화했으면 건너뜀)
+def sync_diaries(sh, title="diaries", max_age=SYNC_INTERVAL, full=False):
+    state = get_sync_state()
+    with state["lock"]:
+        if not state["layout_checked"]:
+            _check_partition_layout()
+            state["layout_checked"] = True
+        synced_at = state["synced_at"].get(title)
+        if not full and synced_at is not None and time.monotonic() - synced_at < max_age: return False
+        try:
+            ws = get_worksheet(sh, title)
+            last_row, tail, full_at = store_get_meta([f"{title}_last_row", f"{title}_tail", f"{title}_full_at"])
+            full = full or last_row is None or time.time() - float(full_at or 0) > SYNC_FULL_EVERY
+            result = None if full else _delta_sync(ws, int(last_row), tail)
+            if result is None:
+                result = _full_reconcile(ws)
+                state["full_syncs"] += 1
+                store_set_meta({f"{title}_full_at": time.time()})
+            else: state["delta_syncs"] += 1
+            store_set_meta({f"{title}_last_row": result[0], f"{title}_tail": result[1]})
+            state["rows_fetched"] += result[2]
+            state["last_error"] = None
+        except Exception as e:
+            state["last_error"] = f"{type(e).__name__}: {e}"
+            invalidate_worksheets()
+            raise
+        finally:
+            # 실패해도 다음 시도는 주기만큼 미룸 (할당량 초과 시 연타 방지)
+            state["synced_at"][title] = time.monotonic()
         return True
-    except: return False
 
-@st.cache_data(ttl=10)
-def get_user_diaries(_sh, username):
-    if not _sh: return {}
+def sync_stats():
+    state, backfill = get_sync_state(), get_backfill_state()
+    return {"partitions": len(state["synced_at"]), "delta_syncs": state["delta_syncs"], "full_syncs": state["full_syncs"],
+            "rows_fetched": state["rows_fetched"], "last_error": state["last_error"],
+            "backfill_done": backfill["done"], "backfill_total": backfill["total"]}
+
+# ⭐️ 파티션 백필: 요청 경로는 보려는 파티션만 맞추므로, 아직 한 번도 동기화하지 않은 파티션({title}_last_row 없음)은
+# 프로세스당 한 번 백그라운드에서 차례로 채움 (새 미러에서도 행복 저장소/분석이 지난 기록을 모두 보도록)
+@st.cache_resource
+def get_backfill_state():
+    return {"total": None, "done": 0, "running": False}
+
+def _backfill_partitions(sh, state):
+    try: titles = [t for t in diary_partitions(sh, refresh=True) if store_get_meta([f"{t}_last_row"])[0] is None]
+    except Exception as e:
+        record_error("sync_backfill", e)
+        titles = []
+    state["total"] = len(titles)
+    for title in titles:
+        try: sync_diaries(sh, title)
+        except Exception as e: record_error("sync_backfill", e)  # 실패한 파티션은 다음 재시작 또는 해당 달을 볼 때 다시
+        state["done"] += 1
+        time.sleep(SYNC_BACKFILL_PAUSE)
+    state["running"] = False
+
+@st.cache_resource
+def start_partition_backfill(_sh):
+    state = get_backfill_state()
+    state["running"] = True
+    threading.Thread(target=_backfill_partitions, args=(_sh, state), daemon=True, name="moodiary-backfill").start()
+    return state
+
+# 요청에 필요한 파티션만 주기적으로 시트와 맞춤 (실패하거나 다른 스레드가 동기화 중이면 로컬 데이터로 진행)
+def ensure_local_store(sh, username=None, months=None):
+    if not sh: return
+    state = get_sync_state()
     try:
-        rows = _sh.worksheet("diaries").get_all_records()
-        user_diaries = {}
-        for row in rows:
-            if str(row['username']) == str(username):
-                user_diaries[row['date']] = {"emotion": row['emotion'], "text": row['text']}
-        return user_diaries
-    except: return {}
+        for title in diary_partitions_for(sh, username, months):
+            synced_at = state["synced_at"].get(title)
+            if synced_at is not None and (state["lock"].locked() or time.monotonic() - synced_at < SYNC_INTERVAL): continue
+            sync_diaries(sh, title)
+    except Exception as e: record_error("sheet_sync", e)
+
+# ⭐️ 사용자별 일기 캐시: 저장 시 작성자 항목만 제자리 갱신 (전체 무효화 없음)
+@st.cache_resource
+def get_diary_cache():
+    return {"entries": OrderedDict(), "lock": threading.Lock(), "hits": 0, "misses": 0, "sheet_fetches": 0}
+
+def diary_cache_stats():
+    cache = get_diary_cache()
+    with cache["lock"]:
+        total = cache["hits"] + cache["misses"]
+        return {"hits": cache["hits"], "misses": cache["misses"], "sheet_fetches": cache["sheet_fetches"],
+                "users": len(cache["entries"]), "hit_rate": cache["hits"] / total if total else 0.0}
+
+def diary_cache_patch(username, date, emotion, text):
+    cache = get_diary_cache()
+    with cache["lock"]:
+        entry = cache["entries"].get(str(username))
+        if entry: entry[1][date] = {"emotion": emotion, "text": text}
+
+# 동기화로 시트 쪽 변경이 들어온 사용자만 캐시에서 제거
+def diary_cache_invalidate(usernames):
+    cache = get_diary_cache()
+    with cache["lock"]:
+        for u in usernames: cache["entries"].pop(str(u), None)
+
+@instrument("get_user_diaries")
+def get_user_diaries(sh, username):
+    if not sh: return {}
+    cache, key = get_diary_cache(), str(username)
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry and time.monotonic() - entry[0] < DIARY_CACHE_TTL:
+            cache["hits"] += 1
+            cache["entries"].move_to_end(key)
+            record_cache("get_user_diaries", True)
+            return dict(entry[1])
+        cache["misses"] += 1
+    record_cache("get_user_diaries", False)
+    ensure_local_store(sh, username=key)
+    diaries = store_get_user_diaries(key)
+    with cache["lock"]:
+        cache["entries"][key] = (time.monotonic(), diaries)
+        cache["entries"].move_to_end(key)
+        while len(cache["entries"]) > DIARY_CACHE_MAX_USERS: cache["entries"].popitem(last=False)
+    return dict(diaries)
+
+# append 응답의 updatedRange (예: "diaries!A12:D12")에서 행 번호 추출
+def _appended_row(resp):
+    rng = ((resp or {}).get("updates") or {}).get("updatedRange", "")
+    m = re.search(r"![A-Z]+(\d+)", rng)
+    return int(m.group(1)) if m else None
+
+# =========================================
+# 📮 저장 대기열 (write-behind outbox)
+# =========================================
+# 저장은 로컬 저장소 + outbox에 한 트랜잭션으로 즉시 기록하고,
+# 백그라운드 flusher가 묶어서 시트에 반영합니다.
+def outbox_enqueue(username, date, emotion, text):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.execute(UPSERT_DIARY_SQL, (str(username), str(date), emotion, text, None))
+        conn.execute(
+            "INSERT INTO outbox (username, date, emotion, text, version, queued_at) VALUES (?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT(username, date) DO UPDATE SET emotion = excluded.emotion, text = excluded.text, "
+            "version = outbox.version + 1, queued_at = excluded.queued_at",
+            (str(username), str(date), emotion, text, time.time()))
+
+# limit=None 이면 전체
+def outbox_peek(limit=OUTBOX_BATCH):
+    store = get_local_store()
+    with store["lock"]:
+        return store["conn"].execute(
+            "SELECT username, date, emotion, text, version FROM outbox ORDER BY queued_at LIMIT ?",
+            (-1 if limit is None else limit,)).fetchall()
+
+# 보내는 도중 다시 수정된 항목(version 변경)은 남겨 두어 다음 차례에 반영
+def outbox_ack(entries):
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.executemany("DELETE FROM outbox WHERE username = ? AND date = ? AND version = ?", entries)
+
+def flush_outbox(sh):
+    entries = outbox_peek()
+    if not entries: return 0
+    partitions = {}
+    for entry in entries: partitions.setdefault(diary_partition(entry[0], entry[1]), []).append(entry)
+    # 파티션별로 반영하고 바로 확인 처리 (뒤 파티션에서 실패해도 앞의 것은 다시 보내지 않음)
+    for title, group in partitions.items():
+        ws = get_diary_worksheet(sh, title, create=True)
+        sync_diaries(sh, title)  # 행 인덱스 준비 (다른 인스턴스가 추가한 행 반영, 실패 시 백오프)
+        cols = worksheet_columns(sh, title)
+        updates, appends = [], []
+        for u, d, e, t, v in group:
+            row = store_get_sheet_row(u, d)
+            if row: updates += [{"range": f"{cols['emotion']}{row}", "values": [[e]]}, {"range": f"{cols['text']}{row}", "values": [[t]]}]
+            else: appends.append((u, d, e, t))
+        # ⭐️ 기존 행 수정은 batch_update 1회, 새 행은 append_rows 1회
+        if updates: ws.batch_update(updates)
+        if appends:
+            first = _appended_row(ws.append_rows([list(a) for a in appends]))
+            if first: store_set_sheet_rows([(first + i, u, d) for i, (u, d, _, _) in enumerate(appends)])
+        outbox_ack([(u, d, v) for u, d, _, _, v in group])
+    return len(entries)
+
+def _outbox_loop(sh, state):
+    while True:
+        state["wake"].wait(timeout=OUTBOX_POLL_SECONDS)
+        state["wake"].clear()
+        wait = state["retry_at"] - time.monotonic()
+        if wait > 0: time.sleep(wait)
+        try:
+            t0 = time.perf_counter()
+            flushed = flush_outbox(sh)
+            if flushed: record_latency("outbox_flush", (time.perf_counter() - t0) * 1000)
+            state["flushed"] += flushed
+            state["backoff"] = 0
+            if flushed >= OUTBOX_BATCH: state["wake"].set()  # 남은 건이 있으면 바로 이어서
+        except Exception as e:
+            # 할당량 초과 등: 지수 백오프 후 재시도 (outbox에 남아 있으므로 유실 없음)
+            record_error("outbox_flush", e)
+            invalidate_worksheets()
+            state["failures"] += 1
+            state["last_error"] = f"{type(e).__name__}: {e}"
+            state["backoff"] = min(OUTBOX_BACKOFF_MAX, max(1, state["backoff"] * 2))
+            state["retry_at"] = time.monotonic() + state["backoff"] + random.random()
+
+@st.cache_resource
+def get_outbox_state():
+    return {"wake": threading.Event(), "flushed": 0, "failures": 0, "backoff": 0, "retry_at": 0.0, "last_error": None}
 
+# 프로세스당 flusher 스레드 1개
+@st.cache_resource
+def start_outbox_flusher(_sh):
+    state = get_outbox_state()
+    threading.Thread(target=_outbox_loop, args=(_sh, state), daemon=True, name="moodiary-outbox").start()
+    return state
+
+def outbox_stats():
+    store = get_local_store()
+    with store["lock"]:
+        pending = store["conn"].execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    state = get_outbox_state()
+    return {"pending": pending, "flushed": state["flushed"], "failures": state["failures"],
+            "backoff": state["backoff"], "last_error": state["last_error"]}
+
+@instrument("add_diary")
 def add_diary(sh, username, date, emotion, text):
     if not sh: return False
-    try:
-        ws = sh.worksheet("diaries")
-        cell = ws.find(date, in_column=2)
-        if cell and str(ws.cell(cell.row, 1).value) == str(username):
-            ws.update_cell(cell.row, 3, emotion)
-            ws.update_cell(cell.row, 4, text)
-        else:
-            ws.append_row([username, date, emotion, text])
-        get_user_diaries.clear()
-        return True
-    except: return False
+    try: outbox_enqueue(username, date, emotion, text)
+    except sqlite3.Error as e:
+        record_error("add_diary", e)
+        return False
+    diary_cache_patch(username, date, emotion, text)
+    start_outbox_flusher(sh)["wake"].set()
+    return True
 
 # =========================================
 # 🧠 4) AI & 추천 로직 (생략)
 # =========================================
-@st.cache_resource
-def load_emotion_model():
+# 내보낸 그래프는 모델 ID별 파일 (모델이 바뀌면 새로 내보냄). MODEL_CACHE_DIR 이 있으면 그 아래에 둠
+def onnx_model_path():
+    base, ext = os.path.splitext(os.path.basename(ONNX_MODEL_PATH))
+    folder = MODEL_CACHE_DIR or os.path.dirname(ONNX_MODEL_PATH)
+    return os.path.join(folder, f"{base}-{EMOTION_MODEL_ID.replace('/', '__')}{ext or '.onnx'}")
+
+# 임시 파일로 내보낸 뒤 교체 (실패해도 반쯤 쓴 파일이 남아 재사용되지 않도록)
+def _export_onnx(model, tokenizer, path):
+    import inspect
+    import torch
+    dummy = dict(tokenizer(["오늘 하루는 어땠나요?"], return_tensors="pt"))
+    names = list(dummy.keys())
+    axes = {k: {0: "batch", 1: "seq"} for k in names}
+    axes["logits"] = {0: "batch"}
+    # 최신 torch 의 기본(dynamo) 내보내기는 onnxscript 가 필요하므로 기존 TorchScript 방식 사용
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    model.config.return_dict = False
+    try:
+        torch.onnx.export(model, (dummy,), tmp, input_names=names, output_names=["logits"],
+                          dynamic_axes=axes, opset_version=14, **extra)
+        os.replace(tmp, path)
+    finally:
+        model.config.return_dict = True  # 실패해 fp32 로 돌아가도 model(**enc).logits 가 동작하도록
+        if os.path.exists(tmp): os.remove(tmp)
+
+# ONNX 세션을 model(**enc).logits 형태로 호출할 수 있게 감쌈 (analyze_diary 계약 유지)
+def _onnx_model(path):
+    import torch
+    import onnxruntime as ort
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    input_names = {i.name for i in session.get_inputs()}
+    def forward(**enc):
+        feeds = {k: v.cpu().numpy() for k, v in enc.items() if k in input_names}
+        return SimpleNamespace(logits=torch.from_numpy(session.run(["logits"], feeds)[0]))
+    return forward
+
+# 디스크 캐시가 있으면 그 폴더에서, 없으면 허브에서 받은 뒤 폴더에 저장
+def _load_pretrained():
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    local_dir = os.path.join(MODEL_CACHE_DIR, EMOTION_MODEL_ID.replace("/", "__")) if MODEL_CACHE_DIR else None
+    if local_dir and os.path.isdir(local_dir):
+        return AutoTokenizer.from_pretrained(local_dir), AutoModelForSequenceClassification.from_pretrained(local_dir)
+    tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL_ID)
+    model = AutoModelForSequenceClassification.from_pretrained(EMOTION_MODEL_ID)
+    if local_dir:
+        try:
+            tokenizer.save_pretrained(local_dir)
+            model.save_pretrained(local_dir)
+        except OSError: pass
+    return tokenizer, model
+
+@st.cache_resource(show_spinner=False)
+def load_emotion_model(backend=None):
+    backend = backend or INFERENCE_BACKEND
     try:
-        tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL_ID)
-        model = AutoModelForSequenceClassification.from_pretrained(EMOTION_MODEL_ID)
+        import torch
+        tokenizer, model = _load_pretrained()
+        model.eval()
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        model.to(device)
         cfg_id2label = getattr(model.config, "id2label", None)
         if isinstance(cfg_id2label, dict) and cfg_id2label: id2label = {int(k): v for k, v in cfg_id2label.items()}
         else: id2label = {0: "기쁨", 1: "분노", 2: "불안", 3: "슬픔", 4: "중립", 5: "힘듦"}
+        # 양자화/ONNX 백엔드는 CPU 전용. ONNX 를 쓸 수 없으면(미설치, 내보내기/세션 실패) fp32 로 진행
+        if backend == "onnx" and not ORT_AVAILABLE: backend = "fp32"
+        if backend == "onnx":
+            try:
+                path = onnx_model_path()
+                if not os.path.exists(path): _export_onnx(model, tokenizer, path)
+                model, device = _onnx_model(path), torch.device("cpu")
+            except Exception as e:
+                record_error("onnx_backend", e)
+                backend = "fp32"
+        if backend == "int8":
+            device = torch.device("cpu")
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "fp32":
+            model.to(device)
+        # 실제로 올라간 백엔드 (결과 캐시 키에 사용)
+        model.inference_backend = backend
         return model, tokenizer, device, id2label
-    except Exception as e: return None, None, None, None
+    except Exception as e:
+        record_error("load_emotion_model", e)
+        return None, None, None, None
 
-def analyze_diary(text, model, tokenizer, device, id2label):
-    if not text or model is None: return None, 0.0
-    enc = tokenizer(text, truncation=True, padding=True, max_length=256, return_tensors="pt")
+# ⭐️ 모델 예열: 프로세스 시작 시 백그라운드 스레드에서 로드하고 화면은 상태만 확인
+@st.cache_resource(show_spinner=False)
+def start_model_warmup():
+    state = {"status": "warming", "ready": threading.Event(), "started": time.time(), "elapsed": None}
+    def warm():
+        bundle = load_emotion_model()
+        state["status"] = "ready" if bundle[0] is not None else "failed"
+        state["elapsed"] = time.time() - state["started"]
+        state["ready"].set()
+    threading.Thread(target=warm, daemon=True, name="moodiary-model-warmup").start()
+    return state
+
+# 청크 1개당 추론 시간(ms) 이동 평균 → 지연 예산 안에서 텍스트당 청크 수 상한 결정
+@st.cache_resource
+def get_inference_stats():
+    return {"ms_per_chunk": None, "lock": threading.Lock()}
+
+def _chunk_limit():
+    ms = get_inference_stats()["ms_per_chunk"]
+    if not ms: return CHUNK_MAX_CHUNKS
+    return max(1, min(CHUNK_MAX_CHUNKS, int(INFER_LATENCY_BUDGET_MS / ms)))
+
+# 청크가 상한보다 많으면 처음~끝을 고르게 남김
+def _select_chunks(mapping, limit):
+    by_text = {}
+    for i, t in enumerate(mapping): by_text.setdefault(t, []).append(i)
+    keep = []
+    for idx in by_text.values():
+        if len(idx) > limit:
+            step = (len(idx) - 1) / max(limit - 1, 1)
+            idx = sorted({idx[round(j * step)] for j in range(limit)})
+        keep.extend(idx)
+    return sorted(keep)
+
+def _aggregate_chunks(probs, lengths, how):
+    if len(probs) == 1: return probs[0]
+    if how == "max":
+        agg = probs.max(dim=0).values
+        return agg / agg.sum()
+    if how == "weighted":
+        w = lengths.float() / lengths.sum()
+        return (probs * w.unsqueeze(1)).sum(dim=0)
+    return probs.mean(dim=0)
+
+# 여러 텍스트를 패딩된 하나의 배치로 한 번에 추론 (긴 텍스트는 겹치는 청크로 분할)
+def analyze_diary_batch(texts, model, tokenizer, device, id2label, chunking=None, aggregation=None):
+    import torch
+    texts = list(texts)
+    chunking = CHUNK_ENABLED if chunking is None else chunking
+    aggregation = aggregation or CHUNK_AGGREGATION
+    # overflow 분할은 fast 토크나이저에서만 배치로 지원됨
+    if chunking and getattr(tokenizer, "is_fast", False):
+        enc = tokenizer(texts, truncation=True, padding=True, max_length=INFER_MAX_LENGTH, stride=CHUNK_STRIDE,
+                        return_overflowing_tokens=True, return_tensors="pt")
+        mapping = enc.pop("overflow_to_sample_mapping").tolist()
+        keep = _select_chunks(mapping, _chunk_limit())
+        enc = {k: v[keep] for k, v in enc.items()}
+        mapping = [mapping[i] for i in keep]
+    else:
+        enc = dict(tokenizer(texts, truncation=True, padding=True, max_length=INFER_MAX_LENGTH, return_tensors="pt"))
+        mapping = list(range(len(texts)))
     for k in enc: enc[k] = enc[k].to(device)
+    t0 = time.perf_counter()
     with torch.no_grad(): logits = model(**enc).logits
-    probs = torch.softmax(logits, dim=1)[0]
-    pred_id = int(probs.argmax().cpu().item())
-    score = float(probs[pred_id].cpu().item())
-    return id2label.get(pred_id, "중립"), score
+    probs = torch.softmax(logits, dim=1).cpu()
+    lengths = enc["attention_mask"].sum(dim=1).cpu()
+    stats = get_inference_stats()
+    with stats["lock"]:
+        ms = (time.perf_counter() - t0) * 1000 / len(mapping)
+        stats["ms_per_chunk"] = ms if stats["ms_per_chunk"] is None else 0.8 * stats["ms_per_chunk"] + 0.2 * ms
+    mapping = torch.tensor(mapping)
+    results = []
+    for i in range(len(texts)):
+        sel = mapping == i
+        p = _aggregate_chunks(probs[sel], lengths[sel], aggregation)
+        pred_id = int(p.argmax())
+        results.append((id2label.get(pred_id, "중립"), float(p[pred_id])))
+    return results
+
+# ⭐️ 백그라운드 추론 워커: 몇 ms 안에 들어온 요청을 모아 한 번의 forward pass로 처리
+def _inference_loop(worker, bundle):
+    q = worker["queue"]
+    while True:
+        batch = [q.get()]
+        deadline = time.monotonic() + INFER_MAX_WAIT_MS / 1000
+        while len(batch) < INFER_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try: batch.append(q.get(timeout=remaining))
+            except queue.Empty: break
+        try:
+            results = analyze_diary_batch([t for t, _ in batch], *bundle)
+            for (_, fut), res in zip(batch, results): fut.set_result(res)
+        except Exception as e:
+            for _, fut in batch: fut.set_exception(e)
+        worker["batches"] += 1
+        worker["items"] += len(batch)
+
+# 모델 인스턴스별 워커 1개 (프로세스 전역)
+@st.cache_resource
+def get_inference_workers():
+    return {"workers": {}, "lock": threading.Lock()}
+
+def get_inference_worker(model, tokenizer, device, id2label):
+    registry = get_inference_workers()
+    with registry["lock"]:
+        worker = registry["workers"].get(id(model))
+        if worker is None:
+            worker = {"queue": queue.Queue(), "batches": 0, "items": 0}
+            threading.Thread(target=_inference_loop, args=(worker, (model, tokenizer, device, id2label)),
+                             daemon=True, name="moodiary-inference").start()
+            registry["workers"][id(model)] = worker
+    return worker
+
+# ⭐️ 감정 분석 결과 캐시: 내용이 같은 재저장은 추론 없이 바로 응답
+@st.cache_resource
+def get_emotion_cache():
+    return {"lru": OrderedDict(), "lock": threading.Lock(), "hits": 0, "disk_hits": 0, "misses": 0}
+
+def emotion_cache_key(text, backend=None):
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    version = f"{EMOTION_MODEL_ID}|{backend or INFERENCE_BACKEND}|{CHUNK_ENABLED}:{CHUNK_AGGREGATION}:{CHUNK_STRIDE}"
+    return hashlib.sha256(f"{version}\n{normalized}".encode("utf-8")).hexdigest()
+
+def _emotion_cache_remember(key, result):
+    cache = get_emotion_cache()
+    with cache["lock"]:
+        cache["lru"][key] = result
+        cache["lru"].move_to_end(key)
+        while len(cache["lru"]) > EMOTION_CACHE_SIZE: cache["lru"].popitem(last=False)
+
+def emotion_cache_get(key):
+    cache = get_emotion_cache()
+    with cache["lock"]:
+        if key in cache["lru"]:
+            cache["hits"] += 1
+            cache["lru"].move_to_end(key)
+            return cache["lru"][key]
+    if EMOTION_CACHE_PERSIST:
+        store = get_local_store()
+        with store["lock"], store["conn"] as conn:
+            row = conn.execute("SELECT label, score FROM emotion_cache WHERE key = ?", (key,)).fetchone()
+            if row: conn.execute("UPDATE emotion_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+        if row:
+            _emotion_cache_remember(key, (row[0], row[1]))
+            with cache["lock"]: cache["disk_hits"] += 1
+            return row[0], row[1]
+    with cache["lock"]: cache["misses"] += 1
+    return None
+
+def emotion_cache_put(key, result):
+    _emotion_cache_remember(key, result)
+    if not EMOTION_CACHE_PERSIST: return
+    store = get_local_store()
+    with store["lock"], store["conn"] as conn:
+        conn.execute("INSERT OR REPLACE INTO emotion_cache (key, label, score, used_at) VALUES (?, ?, ?, ?)",
+                     (key, result[0], result[1], time.time()))
+        # 가끔 오래된 항목 정리 (디스크 캐시 크기 상한)
+        if get_emotion_cache()["misses"] % 500 == 0:
+            conn.execute("DELETE FROM emotion_cache WHERE key NOT IN "
+                         "(SELECT key FROM emotion_cache ORDER BY used_at DESC LIMIT ?)", (EMOTION_CACHE_DISK_MAX,))
+
+def emotion_cache_stats():
+    cache = get_emotion_cache()
+    with cache["lock"]:
+        total = cache["hits"] + cache["disk_hits"] + cache["misses"]
+        return {"hits": cache["hits"], "disk_hits": cache["disk_hits"], "misses": cache["misses"],
+                "size": len(cache["lru"]), "hit_rate": (cache["hits"] + cache["disk_hits"]) / total if total else 0.0}
+
+@instrument("analyze_diary")
+def analyze_diary(text, model, tokenizer, device, id2label):
+    if not text or model is None: return None, 0.0
+    key = emotion_cache_key(text, getattr(model, "inference_backend", None))
+    cached = emotion_cache_get(key)
+    record_cache("analyze_diary", cached is not None)
+    if cached: return cached
+    fut = Future()
+    get_inference_worker(model, tokenizer, device, id2label)["queue"].put((text, fut))
+    result = fut.result(timeout=60)
+    emotion_cache_put(key, result)
+    return result
 
 @st.cache_resource
 def get_spotify_client():
@@ -272,68 +1377,266 @@ def get_spotify_client():
         sp = spotipy.Spotify(client_credentials_manager=manager, retries=3, backoff_factor=0.3)
         sp.search(q="test", limit=1)
         return sp
-    except: return "로그인 실패"
+    except Exception as e:
+        record_error("spotify_client", e)
+        return "로그인 실패"
 
-def recommend_music(emotion):
-    sp = get_spotify_client()
-    if not isinstance(sp, spotipy.Spotify): return [{"error": sp}]
-    SEARCH_KEYWORDS = {
-        "기쁨": ["신나는 K-Pop", "Upbeat", "Happy Hits"], "슬픔": ["Ballad", "Sad Songs", "새벽 감성"],
-        "분노": ["Rock", "Hip Hop", "Workout"], "불안": ["Lofi", "Piano", "Calm"],
-        "힘듦": ["Healing", "Acoustic", "Comfort"], "중립": ["Chill", "K-Pop", "Daily"]
-    }
-    query = random.choice(SEARCH_KEYWORDS.get(emotion, SEARCH_KEYWORDS["중립"]))
+# 감정별 음악 검색 키워드 (음악 후보 풀의 원본 정의)
+SEARCH_KEYWORDS = {
+    "기쁨": ["신나는 K-Pop", "Upbeat", "Happy Hits"], "슬픔": ["Ballad", "Sad Songs", "새벽 감성"],
+    "분노": ["Rock", "Hip Hop", "Workout"], "불안": ["Lofi", "Piano", "Calm"],
+    "힘듦": ["Healing", "Acoustic", "Comfort"], "중립": ["Chill", "K-Pop", "Daily"]
+}
+
+# ⭐️ 추천 후보 풀: 한 번 모아 두고 로컬에서 샘플링, TTL이 지나면 백그라운드에서 갱신
+@st.cache_resource
+def get_reco_pools():
+    return {"pools": {}, "lock": threading.Lock(),
+            "executor": ThreadPoolExecutor(max_workers=4, thread_name_prefix="moodiary-reco")}
+
+def _refresh_pool(pool, loader):
     try:
-        results = sp.search(q=query, type="playlist", limit=10, market="KR")
-        playlists = results.get("playlists", {}).get("items", [])
-        if not playlists: return [{"error": "검색 실패"}]
-        valid_tracks = []
+        items = loader()
+        if items: pool["items"], pool["loaded_at"] = items, time.monotonic()
+    finally:
+        pool["refreshing"] = None
+
+def get_pooled(key, loader, ttl, wait=15):
+    registry = get_reco_pools()
+    with registry["lock"]:
+        pool = registry["pools"].setdefault(key, {"items": [], "loaded_at": None, "refreshing": None})
+        stale = pool["loaded_at"] is None or time.monotonic() - pool["loaded_at"] > ttl
+        if stale and pool["refreshing"] is None:
+            pool["refreshing"] = registry["executor"].submit(_refresh_pool, pool, loader)
+        pending, items = pool["refreshing"], pool["items"]
+    record_cache(f"{key[0]}_pool", bool(items))
+    # 풀이 비어 있을 때(최초 1회)만 채워질 때까지 기다림
+    if not items and pending is not None:
+        try: pending.result(timeout=wait)
+        except Exception: pass
+        items = pool["items"]
+    return items
+
+def _safe_call(fn, *args, **kwargs):
+    try: return fn(*args, **kwargs)
+    except Exception as e:
+        record_error("reco_fetch", e)
+        return None
+
+def _load_music_pool(sp, emotion):
+    keywords = SEARCH_KEYWORDS.get(emotion, SEARCH_KEYWORDS["중립"])
+    with ThreadPoolExecutor(max_workers=RECO_FETCH_WORKERS) as ex:
+        searches = ex.map(lambda q: _safe_call(sp.search, q=q, type="playlist", limit=10, market="KR"), keywords)
+        playlists = [pl for res in searches for pl in ((res or {}).get("playlists") or {}).get("items", []) if pl and pl.get("id")]
         random.shuffle(playlists)
-        for pl in playlists:
-            try:
-                tracks = sp.playlist_items(pl["id"], limit=30)
-                items = tracks.get("items", []) if tracks else []
-                for it in items:
-                    t = it.get("track")
-                    if t and t.get("id"): valid_tracks.append({"id": t["id"], "title": t["name"]})
-                if len(valid_tracks) >= 10: break
-            except: continue
-        if not valid_tracks: return [{"error": "곡 없음"}]
-        seen = set(); unique = []
-        for v in valid_tracks:
-            if v["id"] not in seen: unique.append(v); seen.add(v["id"])
-        return random.sample(unique, k=min(3, len(unique)))
-    except Exception as e: return [{"error": f"오류: {e}"}]
+        track_pages = ex.map(lambda pl: _safe_call(sp.playlist_items, pl["id"], limit=30), playlists[:MUSIC_POOL_PLAYLISTS])
+        seen, tracks = set(), []
+        for page in track_pages:
+            for it in (page or {}).get("items", []):
+                t = (it or {}).get("track")
+                if t and t.get("id") and t["id"] not in seen:
+                    tracks.append({"id": t["id"], "title": t["name"]}); seen.add(t["id"])
+    return tracks
+
+@instrument("recommend_music")
+def recommend_music(emotion):
+    sp = get_spotify_client()
+    if isinstance(sp, str): return [{"error": sp}]
+    if emotion not in SEARCH_KEYWORDS: emotion = "중립"
+    tracks = get_pooled(("music", emotion), lambda: _load_music_pool(sp, emotion), MUSIC_POOL_TTL)
+    if not tracks: return [{"error": "곡 없음"}]
+    return random.sample(tracks, k=min(3, len(tracks)))
+
+# 감정별 TMDB 장르 조합 (영화 후보 풀의 원본 정의)
+GENRES = {"기쁨": "35|10749", "분노": "28|12", "불안": "16|10751", "슬픔": "18", "힘듦": "18|10402", "중립": "35|18"}
 
+# keep-alive 연결 재사용 + 일시 오류 재시도
+@st.cache_resource
+def get_tmdb_session():
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=RECO_FETCH_WORKERS, max_retries=retry))
+    return session
+
+def _fetch_movie_page(key, genres, page):
+    r = get_tmdb_session().get(f"{TMDB_BASE_URL}/discover/movie", params={
+        "api_key": key, "language": "ko-KR", "sort_by": "popularity.desc",
+        "with_genres": genres, "without_genres": "16",
+        "page": page, "vote_count.gte": 500, "primary_release_date.gte": "2000-01-01"
+    }, timeout=5)
+    return r.json().get("results", [])
+
+# 1~5페이지를 동시에 받아 한 번만 필터링해 둠
+def _load_movie_pool(key, genres):
+    with ThreadPoolExecutor(max_workers=MOVIE_POOL_PAGES) as ex:
+        pages = list(ex.map(lambda page: _safe_call(_fetch_movie_page, key, genres, page), range(1, MOVIE_POOL_PAGES + 1)))
+    seen, movies = set(), []
+    for results in pages:
+        for m in results or []:
+            if m.get("id") in seen or m.get("vote_average", 0.0) < 7.5 or m.get("vote_count", 0) < 500: continue
+            seen.add(m.get("id"))
+            movies.append({"title": m["title"], "year": (m.get("release_date") or "")[:4], "rating": m["vote_average"], "overview": m["overview"], "poster": f"https://image.tmdb.org/t/p/w500{m['poster_path']}" if m.get("poster_path") else None})
+    return movies
+
+@instrument("recommend_movies")
 def recommend_movies(emotion):
     key = st.secrets.get("tmdb", {}).get("api_key") or st.secrets.get("TMDB_API_KEY") or EMERGENCY_TMDB_KEY
     if not key: return [{"text": "API 키 없음", "poster": None}]
-    GENRES = {"기쁨": "35|10749", "분노": "28|12", "불안": "16|10751", "슬픔": "18", "힘듦": "18|10402", "중립": "35|18"}
-    try:
-        r = requests.get(f"{TMDB_BASE_URL}/discover/movie", params={
-            "api_key": key, "language": "ko-KR", "sort_by": "popularity.desc",
-            "with_genres": GENRES.get(emotion, "18"), "without_genres": "16",
-            "page": random.randint(1, 5), "vote_count.gte": 500, "primary_release_date.gte": "2000-01-01"
-        }, timeout=5)
-        results = r.json().get("results", [])
-        
-        filtered_results = [m for m in results if m.get("vote_average", 0.0) >= 7.5 and m.get("vote_count", 0) >= 500]
-        
-        if not filtered_results: return [{"text": "조건에 맞는 영화가 없습니다.", "poster": None}]
-        picks = random.sample(filtered_results, min(3, len(filtered_results)))
-        return [{"title": m["title"], "year": (m.get("release_date") or "")[:4], "rating": m["vote_average"], "overview": m["overview"], "poster": f"https://image.tmdb.org/t/p/w500{m['poster_path']}" if m.get("poster_path") else None} for m in picks]
-    except Exception as e: return [{"text": f"오류: {e}", "poster": None}]
+    genres = GENRES.get(emotion, "18")
+    movies = get_pooled(("movie", genres), lambda: _load_movie_pool(key, genres), MOVIE_POOL_TTL)
+    if not movies: return [{"text": "조건에 맞는 영화가 없습니다.", "poster": None}]
+    return random.sample(movies, min(3, len(movies)))
+
+# =========================================
+# 💾 5) 저장 파이프라인 (분석 → 음악/영화/시트 저장 동시 실행)
+# =========================================
+@st.cache_resource
+def get_save_executor():
+    return ThreadPoolExecutor(max_workers=16, thread_name_prefix="moodiary-save")
+
+def run_save_pipeline(sh, username, date, text, bundle):
+    timings = {}
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        try: return fn(*args)
+        finally: timings[name] = time.perf_counter() - start
+
+    t0 = time.perf_counter()
+    emo, score = timed("analyze", analyze_diary, text, *bundle)
+    # 세 I/O 단계는 감정 라벨에만 의존하므로 동시에 실행
+    ex = get_save_executor()
+    started = time.perf_counter()
+    futures = {
+        "music": ex.submit(timed, "music", recommend_music, emo),
+        "movies": ex.submit(timed, "movies", recommend_movies, emo),
+        "save": ex.submit(timed, "save", add_diary, sh, username, date, emo, text),
+    }
+    results, timed_out = {}, []
+    for name, fut in futures.items():
+        try: results[name] = fut.result(timeout=max(0.0, started + SAVE_STEP_TIMEOUTS[name] - time.perf_counter()))
+        except FutureTimeoutError: results[name] = None; timed_out.append(name)
+        except Exception: results[name] = None
+    timings["total"] = time.perf_counter() - t0
+    return {
+        "emotion": emo, "score": score,
+        "music": results["music"] or [{"error": "시간 초과" if "music" in timed_out else "오류"}],
+        "movies": results["movies"] or [{"text": "시간 초과" if "movies" in timed_out else "오류", "poster": None}],
+        # 저장이 제한 시간을 넘기면 백그라운드에서 계속 진행됨
+        "saved": bool(results["save"]), "save_pending": "save" in timed_out,
+        "timings": timings, "timed_out": timed_out,
+    }
+
+def format_timings(timings):
+    names = {"analyze": "분석", "music": "음악", "movies": "영화", "save": "저장", "total": "합계"}
+    return " · ".join(f"{label} {timings[k]:.2f}s" for k, label in names.items() if k in timings)
 
 # =========================================
 # 🖥️ 화면 및 네비게이션 로직
 # =========================================
-apply_custom_css()
+# ⭐️ 버튼은 on_click 콜백에서 상태만 바꾸고, 클릭으로 시작되는 한 번의 실행에서 바로 새 화면을 그림 (st.rerun() 재실행 없음)
+def begin_interaction(name):
+    st.session_state.interaction = name
+    record_interaction(name)
+
+def navigate(name, page, **updates):
+    begin_interaction(name)
+    st.session_state.page = page
+    for k, v in updates.items(): st.session_state[k] = v
+
+# 콜백에서 만든 메시지는 다음 화면의 해당 위치에서 한 번만 표시
+def flash(slot, kind, text):
+    st.session_state[f"flash_{slot}"] = (kind, text)
 
-if "logged_in" not in st.session_state: st.session_state.logged_in = False
-if "page" not in st.session_state: st.session_state.page = "intro" 
-if "dark_mode" not in st.session_state: st.session_state.dark_mode = False
+def show_flash(slot):
+    msg = st.session_state.pop(f"flash_{slot}", None)
+    if msg: getattr(st, msg[0])(msg[1])
+
+def retry_db():
+    begin_interaction("db_refresh")
+    init_db.clear()
+
+def do_login(sh):
+    begin_interaction("login_btn")
+    lid, lpw = st.session_state.lid, st.session_state.lpw
+    password = lookup_user(sh, lid)
+    if password is None or password != str(lpw): return flash("login", "error", "아이디/비밀번호 오류")
+    st.session_state.logged_in = True
+    st.session_state.username = lid
+    today_str = datetime.now(KST).strftime("%Y-%m-%d")
+    st.session_state.page = "dashboard" if today_str in get_user_diaries(sh, lid) else "write"
+
+def do_signup(sh):
+    begin_interaction("signup_btn")
+    nid, npw = st.session_state.nid, st.session_state.npw
+    if lookup_user(sh, nid) is not None: flash("signup", "error", "이미 존재함")
+    elif len(nid)<1 or len(npw)!=4: flash("signup", "error", "형식 확인 (비번 4자리)")
+    elif add_user(sh, nid, npw): flash("signup", "success", "가입 성공! 로그인하세요.")
+    else: flash("signup", "error", "가입 실패")
+
+def do_logout():
+    navigate("sb_logout", "intro", logged_in=False)
+
+# 체크박스 값이 바뀌면 CSS는 같은 실행의 맨 앞(apply_custom_css)에서 새 테마로 그려짐
+def toggle_dark_mode():
+    begin_interaction("toggle_dark_mode")
+    st.session_state.dark_mode = st.session_state.toggle_dark_mode
+
+def save_diary(sh):
+    begin_interaction("write_save")
+    txt = st.session_state.diary_text_input
+    st.session_state.diary_input = txt  # 입력값 유지
+    if not txt.strip(): return flash("write", "warning", "내용을 입력해주세요.")
+    with st.spinner("분석 중..."):
+        bundle = load_emotion_model()  # 예열 중이면 완료될 때까지 대기
+        if not bundle[0]: return flash("write", "error", "AI 로드 실패")
+        today = datetime.now(KST).strftime("%Y-%m-%d")
+        result = run_save_pipeline(sh, st.session_state.username, today, txt, bundle)
+    st.session_state.final_emotion = result["emotion"]
+    # 추천 데이터 생성 (저장과 동시에 실행됨)
+    st.session_state.music_recs = result["music"]
+    st.session_state.movie_recs = result["movies"]
+    st.session_state.save_result = {k: result[k] for k in ("saved", "save_pending", "timings")}
+    st.session_state.page = "result"
+
+def show_recommendations(emo):
+    begin_interaction("dash_rec")
+    st.session_state.final_emotion = emo
+    st.session_state.music_recs = recommend_music(emo)
+    st.session_state.movie_recs = recommend_movies(emo)
+    st.session_state.page = "result"
+
+def refresh_music(emo):
+    begin_interaction("music_refresh")
+    st.session_state.music_recs = recommend_music(emo)
+
+def refresh_movies(emo):
+    begin_interaction("movie_refresh")
+    st.session_state.movie_recs = recommend_movies(emo)
+
+def shift_stats_month(name, delta):
+    begin_interaction(name)
+    months = st.session_state.stats_year * 12 + st.session_state.stats_month - 1 + delta
+    st.session_state.stats_year, st.session_state.stats_month = divmod(months, 12)
+    st.session_state.stats_month += 1
+
+# 달력 월 이동 (delta=None 이면 이번 달)
+def shift_cal_month(name, delta):
+    begin_interaction(name)
+    if delta is None:
+        st.session_state.cal_month = datetime.now(KST).strftime("%Y-%m")
+        return
+    year, month = divmod(int(st.session_state.cal_month[:4]) * 12 + int(st.session_state.cal_month[5:]) - 1 + delta, 12)
+    st.session_state.cal_month = f"{year}-{month + 1:02d}"
+
+def load_more_happy(username, target_prefix):
+    begin_interaction("happy_more")
+    view = st.session_state.happy_view
+    page = store_emotion_page(username, '기쁨', target_prefix, before=view["cards"][-1][0])
+    view["cards"] = view["cards"] + page
+    view["done"] = len(page) < HAPPY_PAGE_SIZE
 
 # 0. 표지 (Intro) 페이지
+@instrument("intro_page")
 def intro_page():
     st.write("")
     st.write("")
@@ -346,12 +1649,11 @@ def intro_page():
                 <br>
             </div>
         """, unsafe_allow_html=True)
-        # ⭐️ 버튼 클릭 시 상태 변경 및 rerun
-        if st.button("✨ 내 마음 기록하러 가기", use_container_width=True, key="intro_start"):
-            st.session_state.page = "login"
-            st.rerun()
+        # ⭐️ 버튼 클릭 시 콜백에서 상태 변경
+        st.button("✨ 내 마음 기록하러 가기", use_container_width=True, key="intro_start", on_click=navigate, args=("intro_start", "login"))
 
 # 1. 로그인 페이지
+@instrument("login_page")
 def login_page():
     sh = init_db()
     
@@ -371,81 +1673,90 @@ def login_page():
         
         if sh is None:
             st.warning("⚠️ DB 연결 중입니다...")
-            if st.button("🔄 새로고침"): st.rerun()
+            st.button("🔄 새로고침", on_click=retry_db)
             return
 
         with tab1:
-            lid = st.text_input("아이디", key="lid")
-            lpw = st.text_input("비밀번호", type="password", key="lpw")
-            # ⭐️ 로그인 버튼: 상태 변경 및 rerun 명시
-            if st.button("로그인", use_container_width=True, key="login_btn"):
-                users = get_all_users(sh)
-                if str(lid) in users and str(users[str(lid)]) == str(lpw):
-                    st.session_state.logged_in = True
-                    st.session_state.username = lid
-                    
-                    today_str = datetime.now(KST).strftime("%Y-%m-%d")
-                    diaries = get_user_diaries(sh, lid)
-                    if today_str in diaries: st.session_state.page = "dashboard"
-                    else: st.session_state.page = "write"
-                    st.rerun() # ⭐️ 로그인 성공 시 reruN
-                else: 
-                    st.error("아이디/비밀번호 오류")
+            st.text_input("아이디", key="lid")
+            st.text_input("비밀번호", type="password", key="lpw")
+            # ⭐️ 로그인 버튼: 콜백에서 확인 후 상태 변경 (성공하면 같은 실행에서 바로 메인 화면)
+            st.button("로그인", use_container_width=True, key="login_btn", on_click=do_login, args=(sh,))
+            show_flash("login")
             
         with tab2:
-            nid = st.text_input("새 아이디", key="nid")
-            npw = st.text_input("새 비밀번호 (4자리)", type="password", key="npw", max_chars=4)
-            # ⭐️ 가입 버튼: 상태 변경 및 rerun 명시
-            if st.button("가입하기", use_container_width=True, key="signup_btn"):
-                users = get_all_users(sh)
-                if str(nid) in users: st.error("이미 존재함")
-                elif len(nid)<1 or len(npw)!=4: st.error("형식 확인 (비번 4자리)")
-                else:
-                    if add_user(sh, nid, npw): st.success("가입 성공! 로그인하세요.")
-                    else: st.error("가입 실패")
-                st.rerun() # ⭐️ 가입 시도 후 reruN
+            st.text_input("새 아이디", key="nid")
+            st.text_input("새 비밀번호 (4자리)", type="password", key="npw", max_chars=4)
+            # ⭐️ 가입 버튼: 콜백에서 가입 시도, 결과 메시지는 버튼 아래에 표시
+            st.button("가입하기", use_container_width=True, key="signup_btn", on_click=do_signup, args=(sh,))
+            show_flash("signup")
         st.markdown("</div>", unsafe_allow_html=True)
 
+# 관리자 전용: 핫패스별 p50/p95/p99 패널
+def render_metrics_panel():
+    with st.expander("⏱️ 성능 패널 (관리자)"):
+        snapshot = metrics_snapshot()
+        if snapshot:
+            fmt = lambda v: "-" if v is None else f"{v:.1f}"
+            st.dataframe(pd.DataFrame([
+                {"경로": name, "호출": m["count"], "오류": m["errors"], "p50(ms)": fmt(m["p50_ms"]), "p95(ms)": fmt(m["p95_ms"]),
+                 "p99(ms)": fmt(m["p99_ms"]), "캐시 적중률": "-" if m["hit_rate"] is None else f"{m['hit_rate']:.0%}"}
+                for name, m in snapshot.items()]), hide_index=True, use_container_width=True)
+            errors = {name: m["last_error"] for name, m in snapshot.items() if m["last_error"]}
+            if errors: st.caption("최근 오류: " + " / ".join(f"{k}: {v}" for k, v in errors.items()))
+        interactions = interaction_stats()
+        if interactions:
+            st.caption("상호작용당 스크립트 실행 횟수")
+            st.dataframe(pd.DataFrame([{"상호작용": name, "클릭": c["clicks"], "실행": c["runs"],
+                                        "실행/클릭": "-" if c["runs_per_click"] is None else f"{c['runs_per_click']:.2f}"}
+                                       for name, c in interactions.items()]), hide_index=True, use_container_width=True)
+        sync, handles = sync_stats(), worksheet_registry_stats()
+        st.caption(f"저장 대기열: {outbox_stats()['pending']}건 · 시트 동기화({sync['partitions']}개 파티션): 증분 {sync['delta_syncs']}회 / 전체 {sync['full_syncs']}회 (백필 {sync['backfill_done']}/{sync['backfill_total'] or 0}), "
+                   f"읽은 행 {sync['rows_fetched']:,}개 · 워크시트 메타데이터 조회 {handles['metadata_fetches']}회 "
+                   f"(생략한 요청 {handles['round_trips_saved']:,}회)")
+        diaries = diary_cache_stats()
+        st.caption(f"일기 캐시: 적중 {diaries['hits']:,}회 / 미스 {diaries['misses']:,}회 (적중률 {diaries['hit_rate']:.0%}), "
+                   f"사용자 {diaries['users']}명 · 시트 전체 읽기 {diaries['sheet_fetches']}회")
+        st.download_button("Prometheus 텍스트", metrics_prometheus(), file_name="moodiary_metrics.prom", use_container_width=True)
+        st.download_button("JSON lines", metrics_jsonl_line() + "\n", file_name="moodiary_metrics.jsonl", use_container_width=True)
+
 # 2. 메인 앱
+@instrument("main_app")
 def main_app():
     sh = init_db()
     if sh is None:
         st.error("데이터베이스 연결 끊김. 새로고침 해주세요.")
-        if st.button("🔄 새로고침"): st.rerun()
+        st.button("🔄 새로고침", on_click=retry_db)
         return
+    start_outbox_flusher(sh)  # 재시작 전에 남은 저장도 이어서 반영
+    start_partition_backfill(sh)  # 한 번도 동기화하지 않은 파티션은 백그라운드에서 채움
 
     # --- 사이드바 (목차 + 토글) ---
     with st.sidebar:
         st.markdown(f"### 👋 **{st.session_state.username}**님")
         st.write("")
         
-        # ⭐️ [토글 버튼] 야간 모드 버튼
-        is_dark_mode = st.checkbox(
+        # ⭐️ [토글 버튼] 야간 모드 버튼 (변경은 콜백에서 반영 → CSS 갱신에 재실행 불필요)
+        st.checkbox(
             "🌙 야간 모드", 
             value=st.session_state.dark_mode,
             key="toggle_dark_mode",
+            on_change=toggle_dark_mode,
             help="클릭하여 앱의 테마를 밝은 모드와 어두운 모드로 전환합니다."
         )
-        
-        # 야간 모드 상태 변경 시 CSS 갱신을 위해 rerun
-        if is_dark_mode != st.session_state.dark_mode:
-            st.session_state.dark_mode = is_dark_mode
-            st.rerun()
 
         st.divider()
         
-        # ⭐️ [목차] st.button 사용 및 st.rerun() 명시 (작동 보장)
-        if st.button("📝 일기 작성", use_container_width=True, key="sb_write"): st.session_state.page = "write"; st.rerun()
-        if st.button("📅 감정 달력", use_container_width=True, key="sb_calendar"): st.session_state.page = "dashboard"; st.rerun()
-        if st.button("🎵 음악/영화 추천", use_container_width=True, key="sb_recommend"): st.session_state.page = "result"; st.rerun()
-        if st.button("📊 통계 보기", use_container_width=True, key="sb_stats"): st.session_state.page = "stats"; st.rerun()
-        if st.button("📂 행복 저장소", use_container_width=True, key="sb_happy"): st.session_state.page = "happy"; st.rerun()
+        # ⭐️ [목차] on_click 콜백으로 페이지 전환 (클릭 1회 = 실행 1회)
+        st.button("📝 일기 작성", use_container_width=True, key="sb_write", on_click=navigate, args=("sb_write", "write"))
+        st.button("📅 감정 달력", use_container_width=True, key="sb_calendar", on_click=navigate, args=("sb_calendar", "dashboard"))
+        st.button("🎵 음악/영화 추천", use_container_width=True, key="sb_recommend", on_click=navigate, args=("sb_recommend", "result"))
+        st.button("📊 통계 보기", use_container_width=True, key="sb_stats", on_click=navigate, args=("sb_stats", "stats"))
+        st.button("📂 행복 저장소", use_container_width=True, key="sb_happy", on_click=navigate, args=("sb_happy", "happy"))
+
+        if st.session_state.username in ADMIN_USERS: render_metrics_panel()
 
         st.divider()
-        if st.button("🚪 로그아웃", use_container_width=True, key="sb_logout"):
-            st.session_state.logged_in = False
-            st.session_state.page = "intro"
-            st.rerun() # ⭐️ 로그아웃 시 reruN
+        st.button("🚪 로그아웃", use_container_width=True, key="sb_logout", on_click=do_logout)
 
     # --- 라우팅 ---
     if st.session_state.page == "write": page_write(sh)
@@ -455,91 +1766,114 @@ def main_app():
     elif st.session_state.page == "happy": page_happy_storage(sh)
 
 # --- 페이지 함수들 ---
+@instrument("page_write")
 def page_write(sh):
     st.markdown("## 📝 오늘의 이야기")
-    model, tokenizer, device, id2label = load_emotion_model()
-    if not model: st.error("AI 로드 실패"); return
+    warmup = start_model_warmup()
+    if warmup["status"] == "failed": st.error("AI 로드 실패"); return
+    if warmup["status"] == "warming": st.caption("🧠 AI 모델 준비 중이에요. 먼저 일기를 써 두셔도 괜찮아요.")
 
     if "diary_input" not in st.session_state: st.session_state.diary_input = ""
     # st.text_area는 폼 외부에 두어 상태를 유지
-    txt = st.text_area("오늘 하루는 어땠나요?", value=st.session_state.diary_input, height=300, placeholder="오늘 있었던 일과 감정을 자유롭게 적어주세요...", key="diary_text_input")
+    st.text_area("오늘 하루는 어땠나요?", value=st.session_state.diary_input, height=300, placeholder="오늘 있었던 일과 감정을 자유롭게 적어주세요...", key="diary_text_input")
     
-    # ⭐️ 감정 분석 및 저장 버튼: 상태 변경 및 rerun 명시
-    if st.button("🔍 감정 분석하고 저장하기", type="primary", use_container_width=True, key="write_save"):
-        if not txt.strip(): 
-            st.warning("내용을 입력해주세요."); 
-            st.session_state.diary_input = txt # 입력값 유지
-            st.rerun()
-            return
-            
-        # 폼 제출 성공 및 분석 시작
-        with st.spinner("분석 중..."):
-            emo, sc = analyze_diary(txt, model, tokenizer, device, id2label)
-            st.session_state.final_emotion = emo
-            # 추천 데이터 생성
-            st.session_state.music_recs = recommend_music(emo)
-            st.session_state.movie_recs = recommend_movies(emo)
-            
-            today = datetime.now(KST).strftime("%Y-%m-%d")
-            add_diary(sh, st.session_state.username, today, emo, txt)
-            
-            st.session_state.page = "result"
-            st.rerun() # ⭐️ 페이지 이동을 위해 명시적 리런
+    # ⭐️ 감정 분석 및 저장 버튼: 콜백에서 분석/저장 후 결과 페이지로 (같은 실행에서 결과 화면을 그림)
+    st.button("🔍 감정 분석하고 저장하기", type="primary", use_container_width=True, key="write_save", on_click=save_diary, args=(sh,))
+    show_flash("write")
 
-def page_dashboard(sh):
-    st.markdown("## 📅 감정 달력")
-    cols = st.columns(6)
-    for i, (k, v) in enumerate(EMOTION_META.items()):
-        cols[i].markdown(f"<span style='color:{v['color'].replace('0.6','1')}; font-size:1.5em;'>●</span> {k}", unsafe_allow_html=True)
-    
-    my_diaries = get_user_diaries(sh, st.session_state.username)
+# ⭐️ 달력 이벤트 메모: (사용자, 월, 테마)별로 보이는 범위(+여유)만 만들고, 해당 월 일기가 바뀔 때만 다시 생성
+CALENDAR_MARGIN_BEFORE = timedelta(days=7)
+CALENDAR_MARGIN_AFTER = timedelta(days=14)
+
+@st.cache_resource
+def get_calendar_memo():
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+def _adjacent_months(ym):
+    first = datetime.strptime(ym, "%Y-%m")
+    prev_month = (first - timedelta(days=1)).strftime("%Y-%m")
+    next_month = (first + timedelta(days=32)).strftime("%Y-%m")
+    return prev_month, ym, next_month
+
+def calendar_events(username, ym, dark):
+    months = _adjacent_months(ym)
+    version = tuple(store_month_version(username, m) for m in months)
+    memo, key = get_calendar_memo(), (str(username), ym, dark)
+    with memo["lock"]:
+        hit = memo["entries"].get(key)
+        if hit and hit[0] == version:
+            memo["entries"].move_to_end(key)
+            return hit[1]
+    first = datetime.strptime(ym, "%Y-%m")
+    last = datetime.strptime(months[2], "%Y-%m") - timedelta(days=1)
+    start = (first - CALENDAR_MARGIN_BEFORE).strftime("%Y-%m-%d")
+    end = (last + CALENDAR_MARGIN_AFTER).strftime("%Y-%m-%d")
+    # 달력 텍스트 색상 조건부 설정 (야간 모드 가시성 확보)
+    text_color = "#f0f0f0" if dark else "#000000"
     events = []
-    for date_str, data in my_diaries.items():
+    for date_str, data in sorted(store_get_diaries_between(username, start, end).items()):
         emo = data.get("emotion", "중립")
         if emo not in EMOTION_META: emo = "중립"
         meta = EMOTION_META[emo]
-        # 달력 텍스트 색상 조건부 설정 (야간 모드 가시성 확보)
-        text_color = "#f0f0f0" if st.session_state.get("dark_mode", False) else "#000000"
         events.append({"start": date_str, "display": "background", "backgroundColor": meta["color"]})
         events.append({"title": meta["emoji"], "start": date_str, "allDay": True, "backgroundColor": "transparent", "borderColor": "transparent", "textColor": text_color})
+    with memo["lock"]:
+        memo["entries"][key] = (version, events)
+        memo["entries"].move_to_end(key)
+        while len(memo["entries"]) > 2000: memo["entries"].popitem(last=False)
+    return events
+
+@instrument("page_dashboard")
+def page_dashboard(sh):
+    st.markdown("## 📅 감정 달력")
+    cols = st.columns(6)
+    for i, (k, v) in enumerate(EMOTION_META.items()):
+        cols[i].markdown(f"<span style='color:{v['color'].replace('0.6','1')}; font-size:1.5em;'>●</span> {k}", unsafe_allow_html=True)
+    
+    username = st.session_state.username
+    today_str = datetime.now(KST).strftime("%Y-%m-%d")
+    if "cal_month" not in st.session_state: st.session_state.cal_month = today_str[:7]
+    ensure_local_store(sh, username=username, months=_adjacent_months(st.session_state.cal_month))
+    events = calendar_events(username, st.session_state.cal_month, st.session_state.get("dark_mode", False))
+    
+    # ⭐️ 월 이동은 앱 버튼으로 (달력 컴포넌트는 보이는 월을 알려주지 않으므로, 넘긴 달의 이벤트를 보내고 그 달로 다시 그림)
+    c1, c2, c3 = st.columns([0.2, 0.6, 0.2])
+    with c1: st.button("◀️", use_container_width=True, key="prev_cal", on_click=shift_cal_month, args=("prev_cal", -1))
+    with c2: st.button("📅 이번 달", use_container_width=True, key="today_cal", on_click=shift_cal_month, args=("today_cal", None))
+    with c3: st.button("▶️", use_container_width=True, key="next_cal", on_click=shift_cal_month, args=("next_cal", 1))
     
-    calendar(events=events, options={"headerToolbar": {"left": "prev,next today", "center": "title", "right": ""}, "initialView": "dayGridMonth"},
+    calendar(events=events, options={"headerToolbar": {"left": "", "center": "title", "right": ""}, "initialView": "dayGridMonth", "initialDate": f"{st.session_state.cal_month}-01"},
               custom_css="""
               .fc-event-title { font-size: 3em !important; display: flex; justify-content: center; align-items: center; height: 100%; transform: translateY(-25px); text-shadow: 1px 1px 2px rgba(0,0,0,0.2); }
               .fc-daygrid-event { border: none !important; background-color: transparent !important; }
               .fc-daygrid-day-number { z-index: 10 !important; color: var(--main-text-color, black); font-weight: bold; }
               .fc-bg-event { opacity: 1.0 !important; }
               .fc-col-header-cell-cushion { color: var(--main-text-color, #333); font-weight: bold; }
-              """
+              """,
+              key=f"mood_calendar_{st.session_state.cal_month}"  # initialDate는 처음 그릴 때만 적용되므로 월마다 새로 그림
               )
     
+    today_entry = store_get_diary(username, today_str)
+    my_diaries = {today_str: today_entry} if today_entry else {}
+    
     st.write("")
-    today_str = datetime.now(KST).strftime("%Y-%m-%d")
     if today_str in my_diaries:
         st.success(f"오늘의 기록 완료! ({my_diaries[today_str]['emotion']})")
         c1, c2 = st.columns(2)
         with c1:
-             # ⭐️ 일기 수정하기 버튼: 상태 변경 및 rerun 명시
-            if st.button("✏️ 일기 수정하기", use_container_width=True, key="dash_edit"):
-                st.session_state.diary_input = my_diaries[today_str]["text"]
-                st.session_state.page = "write"
-                st.rerun()
+             # ⭐️ 일기 수정하기 버튼: 콜백에서 상태 변경
+            st.button("✏️ 일기 수정하기", use_container_width=True, key="dash_edit", on_click=navigate,
+                      args=("dash_edit", "write"), kwargs={"diary_input": my_diaries[today_str]["text"]})
         with c2:
-             # ⭐️ 오늘의 추천 보기 버튼: 상태 변경 및 rerun 명시
-            if st.button("🎵 오늘의 추천 보기", type="primary", use_container_width=True, key="dash_rec"):
-                emo = my_diaries[today_str]["emotion"]
-                st.session_state.final_emotion = emo
-                st.session_state.music_recs = recommend_music(emo)
-                st.session_state.movie_recs = recommend_movies(emo)
-                st.session_state.page = "result"
-                st.rerun()
+             # ⭐️ 오늘의 추천 보기 버튼: 콜백에서 추천 생성 및 상태 변경
+            st.button("🎵 오늘의 추천 보기", type="primary", use_container_width=True, key="dash_rec",
+                      on_click=show_recommendations, args=(my_diaries[today_str]["emotion"],))
     else:
-        # ⭐️ 오늘의 일기 쓰러 가기 버튼: 상태 변경 및 rerun 명시
-        if st.button("✏️ 오늘의 일기 쓰러 가기", type="primary", use_container_width=True, key="dash_write"):
-            st.session_state.diary_input = ""
-            st.session_state.page = "write"
-            st.rerun()
+        # ⭐️ 오늘의 일기 쓰러 가기 버튼: 콜백에서 상태 변경
+        st.button("✏️ 오늘의 일기 쓰러 가기", type="primary", use_container_width=True, key="dash_write",
+                  on_click=navigate, args=("dash_write", "write"), kwargs={"diary_input": ""})
 
+@instrument("page_recommend")
 def page_recommend(sh):
     st.markdown("## 🎵 음악/영화 추천")
 
@@ -552,34 +1886,34 @@ def page_recommend(sh):
             st.session_state.movie_recs = recommend_movies(st.session_state.final_emotion)
         else:
             st.info("작성된 일기가 없습니다.")
-            # ⭐️ 일기 쓰러 가기 버튼: 상태 변경 및 rerun 명시
-            if st.button("일기 쓰러 가기", type="primary", key="rec_gtn"):
-                st.session_state.page = "write"
-                st.rerun()
+            # ⭐️ 일기 쓰러 가기 버튼: 콜백에서 상태 변경
+            st.button("일기 쓰러 가기", type="primary", key="rec_gtn", on_click=navigate, args=("rec_gtn", "write"))
             return
 
     emo = st.session_state.final_emotion
     if emo not in EMOTION_META: emo = "중립"
     meta = EMOTION_META[emo]
     st.markdown(f"""<div style='text-align: center; padding: 2rem;'><h2 style='color: {meta['color'].replace('0.6', '1.0').replace('0.5', '1.0')}; font-size: 3rem;'>{meta['emoji']} 오늘의 감정: {emo}</h2><h4 style='color: #555;'>{meta['desc']}</h4></div>""", unsafe_allow_html=True)
+    # 직전 저장 결과 (단계별 소요 시간)
+    save_result = st.session_state.pop("save_result", None)
+    if save_result:
+        if save_result["save_pending"]: st.info("💾 일기 저장이 지연되고 있어요. 백그라운드에서 계속 저장합니다.")
+        elif not save_result["saved"]: st.warning("⚠️ 일기 저장에 실패했어요. 잠시 후 다시 저장해주세요.")
+        st.caption(f"⏱️ {format_timings(save_result['timings'])}")
     
     c1, c2 = st.columns(2)
     with c1:
         st.markdown("#### 🎵 추천 음악")
-        # ⭐️ 음악 새로고침 버튼: 추천 재생성 및 rerun 명시
-        if st.button("🔄 음악 새로고침", use_container_width=True, key="music_refresh"):
-            st.session_state.music_recs = recommend_music(emo)
-            st.rerun()
+        # ⭐️ 음악 새로고침 버튼: 콜백에서 추천 재생성
+        st.button("🔄 음악 새로고침", use_container_width=True, key="music_refresh", on_click=refresh_music, args=(emo,))
         for item in st.session_state.get("music_recs", []):
             if item.get('id'):
                 # ⭐️ Spotify iframe 높이 500으로 수정
                 components.iframe(f"https://open.spotify.com/embed/track/{item['id']}?utm_source=generator", height=500, width="100%")
     with c2:
         st.markdown("#### 🎬 추천 영화")
-        # ⭐️ 영화 새로고침 버튼: 추천 재생성 및 rerun 명시
-        if st.button("🔄 영화 새로고침", use_container_width=True, key="movie_refresh"):
-            st.session_state.movie_recs = recommend_movies(emo)
-            st.rerun()
+        # ⭐️ 영화 새로고침 버튼: 콜백에서 추천 재생성
+        st.button("🔄 영화 새로고침", use_container_width=True, key="movie_refresh", on_click=refresh_movies, args=(emo,))
         for item in st.session_state.get('movie_recs', []):
             if item.get('poster'):
                 # ⭐️ 영화 추천 카드 디자인 유지
@@ -590,15 +1924,58 @@ def page_recommend(sh):
     st.divider()
     b1, b2, b3 = st.columns(3)
     with b1:
-        # ⭐️ 달력 보기 버튼: 상태 변경 및 rerun 명시
-        if st.button("📅 달력 보기", use_container_width=True, key="rec_cal"): st.session_state.page = "dashboard"; st.rerun()
+        # ⭐️ 달력 보기 버튼: 콜백에서 페이지 전환
+        st.button("📅 달력 보기", use_container_width=True, key="rec_cal", on_click=navigate, args=("rec_cal", "dashboard"))
     with b2:
-        # ⭐️ 통계 보기 버튼: 상태 변경 및 rerun 명시
-        if st.button("📊 통계 보기", use_container_width=True, key="rec_stat"): st.session_state.page = "stats"; st.rerun()
+        # ⭐️ 통계 보기 버튼: 콜백에서 페이지 전환
+        st.button("📊 통계 보기", use_container_width=True, key="rec_stat", on_click=navigate, args=("rec_stat", "stats"))
     with b3:
-        # ⭐️ 행복 저장소 버튼: 상태 변경 및 rerun 명시
-        if st.button("📂 행복 저장소", use_container_width=True, key="rec_happy"): st.session_state.page = "happy"; st.rerun()
+        # ⭐️ 행복 저장소 버튼: 콜백에서 페이지 전환
+        st.button("📂 행복 저장소", use_container_width=True, key="rec_happy", on_click=navigate, args=("rec_happy", "happy"))
 
+# ⭐️ 한 달 통계 조각: 요약 HTML(테마별)과 차트 데이터/스펙을 그 달 데이터가 바뀔 때만 다시 만듦
+def build_stats_summary(month_counts, dark):
+    most_common_emo = max(month_counts, key=month_counts.get)
+    total_count = sum(month_counts.values())
+    stat_label_color = "#555" if not dark else "#bbbbbb"
+    stat_divider_color = "rgba(128,128,128,0.3)" if not dark else "#444444"
+    return f"""
+            <div style='display:flex; justify-content:space-around; text-align:center; margin-bottom: 20px;'>
+                <div style='flex:1; padding: 10px 0; border-right: 1px solid {stat_divider_color};'>
+                    <div style='font-size:1.8em; font-weight:700; color:#6C5CE7;'>{total_count}개</div>
+                    <div style='font-size:0.9em; color:{stat_label_color};'>총 기록 수</div>
+                </div>
+                <div style='flex:1; padding: 10px 0; margin-left: 10px;'>
+                    <div style='font-size:1.8em; font-weight:700; color:{EMOTION_META[most_common_emo]['color'].replace('0.6', '1.0')}'>{EMOTION_META[most_common_emo]['emoji']} {most_common_emo}</div>
+                    <div style='font-size:0.9em; color:{stat_label_color};'>가장 많이 느낀 감정</div>
+                </div>
+            </div>
+        """
+
+def build_stats_chart(month_counts):
+    chart_data = pd.DataFrame({"emotion": list(EMOTION_META.keys()), "count": [month_counts.get(e, 0) for e in EMOTION_META]})
+    domain = list(EMOTION_META.keys())
+    range_ = [m['color'].replace('0.6', '1.0').replace('0.5', '1.0') for m in EMOTION_META.values()] 
+    max_val = int(chart_data['count'].max()) if not chart_data.empty else 5
+    y_values = list(range(0, max_val + 2))
+    return chart_data, {
+        "mark": {"type": "bar", "cornerRadius": 10},
+        "encoding": {
+            "x": {
+                "field": "emotion", "type": "nominal", "sort": domain, 
+                "axis": {"labelAngle": 0, "labelFontSize": 12}, "title": "감정"
+            },
+            "y": {
+                "field": "count", "type": "quantitative", 
+                "axis": {"values": y_values, "format": "d", "titleAngle": 0, "titleAlign": "right", "titleY": -10}, 
+                "scale": {"domainMin": 0}, "title": "횟수"
+            },
+            "color": {"field": "emotion", "scale": {"domain": domain, "range": range_}, "legend": None},
+            "tooltip": [{"field": "emotion"}, {"field": "count"}]
+        }
+    }
+
+@instrument("page_stats")
 def page_stats(sh):
     st.markdown("## 📊 나의 감정 통계")
     
@@ -607,97 +1984,60 @@ def page_stats(sh):
         st.session_state.stats_year = now.year
         st.session_state.stats_month = now.month
 
+    stats_month_view(sh)
+
+    st.divider()
+    b1, b2 = st.columns(2)
+    with b1:
+        # ⭐️ 달력 보기 버튼: 콜백에서 페이지 전환
+        st.button("📅 달력 보기", use_container_width=True, key="stats_cal", on_click=navigate, args=("stats_cal", "dashboard"))
+    with b2:
+        # ⭐️ 행복 저장소 버튼: 콜백에서 페이지 전환
+        st.button("📂 행복 저장소 보러가기", use_container_width=True, key="stats_happy", on_click=navigate, args=("stats_happy", "happy"))
+
+# ⭐️ 월 이동은 이 조각만 다시 실행 (사이드바/CSS/페이지 나머지는 그대로)
+@st_fragment
+def stats_month_view(sh):
+    record_fragment_run()
+    dark = st.session_state.get("dark_mode", False)
     c1, c2, c3 = st.columns([0.2, 0.6, 0.2])
     with c1:
-        # ⭐️ 월 이동 버튼 (이전): 상태 변경 및 rerun 명시
-        if st.button("◀️", use_container_width=True, key="prev_stats"):
-            if st.session_state.stats_month == 1:
-                st.session_state.stats_year -= 1
-                st.session_state.stats_month = 12
-            else: st.session_state.stats_month -= 1
-            st.rerun()
+        # ⭐️ 월 이동 버튼 (이전): 콜백에서 월 변경
+        st.button("◀️", use_container_width=True, key="prev_stats", on_click=shift_stats_month, args=("prev_stats", -1))
     with c2:
         # 월/연도 텍스트 색상 직접 지정 (가시성 확보)
-        text_color = "#f0f0f0" if st.session_state.get("dark_mode", False) else "#333"
+        text_color = "#f0f0f0" if dark else "#333"
         st.markdown(f"<h3 style='text-align: center; margin:0; color: {text_color};'>{st.session_state.stats_year}년 {st.session_state.stats_month}월</h3>", unsafe_allow_html=True)
     with c3:
-        # ⭐️ 월 이동 버튼 (다음): 상태 변경 및 rerun 명시
-        if st.button("▶️", use_container_width=True, key="next_stats"):
-            if st.session_state.stats_month == 12:
-                st.session_state.stats_year += 1
-                st.session_state.stats_month = 1
-            else: st.session_state.stats_month += 1
-            st.rerun()
+        # ⭐️ 월 이동 버튼 (다음): 콜백에서 월 변경
+        st.button("▶️", use_container_width=True, key="next_stats", on_click=shift_stats_month, args=("next_stats", 1))
     st.write("")
 
-    my_diaries = get_user_diaries(sh, st.session_state.username)
+    # ⭐️ 월별 집계 테이블에서 한 달 치 감정별 개수만 읽음 (일기 전체를 다시 훑지 않음)
+    username = st.session_state.username
     target_prefix = f"{st.session_state.stats_year}-{st.session_state.stats_month:02d}"
+    ensure_local_store(sh, username=username, months=[target_prefix])
+    version = (username, target_prefix, store_month_version(username, target_prefix))
+    month_counts = store_emotion_counts(username, target_prefix)
     
-    month_data = []
-    for date, d in my_diaries.items():
-        if date.startswith(target_prefix):
-            e = d['emotion']
-            if e in EMOTION_META: month_data.append(e)
-    
-    df = pd.DataFrame(month_data, columns=['emotion'])
-    counts = df['emotion'].value_counts().reindex(EMOTION_META.keys(), fill_value=0)
-    
-    chart_data = counts.reset_index()
-    chart_data.columns = ['emotion', 'count']
-    domain = list(EMOTION_META.keys())
-    range_ = [m['color'].replace('0.6', '1.0').replace('0.5', '1.0') for m in EMOTION_META.values()] 
-    
-    if month_data:
-        max_val = int(chart_data['count'].max()) if not chart_data.empty else 5
-        y_values = list(range(0, max_val + 2))
-        most_common_emo = max(set(month_data), key=month_data.count)
-        total_count = len(month_data)
-
-        # ⭐️ 통계 요약 마크다운
-        stat_label_color = "#555" if not st.session_state.dark_mode else "#bbbbbb"
-        stat_divider_color = "rgba(128,128,128,0.3)" if not st.session_state.dark_mode else "#444444"
-
-        st.markdown(f"""
-            <div style='display:flex; justify-content:space-around; text-align:center; margin-bottom: 20px;'>
-                <div style='flex:1; padding: 10px 0; border-right: 1px solid {stat_divider_color};'>
-                    <div style='font-size:1.8em; font-weight:700; color:#6C5CE7;'>{total_count}개</div>
-                    <div style='font-size:0.9em; color:{stat_label_color};'>총 기록 수</div>
-                </div>
-                <div style='flex:1; padding: 10px 0; margin-left: 10px;'>
-                    <div style='font-size:1.8em; font-weight:700; color:{EMOTION_META[most_common_emo]['color'].replace('0.6', '1.0')}'>{EMOTION_META[most_common_emo]['emoji']} {most_common_emo}</div>
-                    <div style='font-size:0.9em; color:{stat_label_color};'>가장 많이 느낀 감정</div>
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
-        
-        st.vega_lite_chart(chart_data, {
-            "mark": {"type": "bar", "cornerRadius": 10},
-            "encoding": {
-                "x": {
-                    "field": "emotion", "type": "nominal", "sort": domain, 
-                    "axis": {"labelAngle": 0, "labelFontSize": 12}, "title": "감정"
-                },
-                "y": {
-                    "field": "count", "type": "quantitative", 
-                    "axis": {"values": y_values, "format": "d", "titleAngle": 0, "titleAlign": "right", "titleY": -10}, 
-                    "scale": {"domainMin": 0}, "title": "횟수"
-                },
-                "color": {"field": "emotion", "scale": {"domain": domain, "range": range_}, "legend": None},
-                "tooltip": [{"field": "emotion"}, {"field": "count"}]
-            }
-        }, use_container_width=True)
+    if month_counts:
+        # ⭐️ 통계 요약 마크다운 / 차트 (테마·데이터 버전별로 재사용)
+        st.markdown(cached_fragment("stats_summary", (version, dark), lambda: build_stats_summary(month_counts, dark)), unsafe_allow_html=True)
+        chart_data, spec = cached_fragment("stats_chart", version, lambda: build_stats_chart(month_counts))
+        st.vega_lite_chart(chart_data, spec, use_container_width=True)
     else:
         st.info("이 달에는 작성된 일기가 없습니다.")
 
-    st.divider()
-    b1, b2 = st.columns(2)
-    with b1:
-        # ⭐️ 달력 보기 버튼: 상태 변경 및 rerun 명시
-        if st.button("📅 달력 보기", use_container_width=True, key="stats_cal"): st.session_state.page = "dashboard"; st.rerun()
-    with b2:
-        # ⭐️ 행복 저장소 버튼: 상태 변경 및 rerun 명시
-        if st.button("📂 행복 저장소 보러가기", use_container_width=True, key="stats_happy"): st.session_state.page = "happy"; st.rerun()
+# ⭐️ 행복 카드 HTML: 한 페이지 묶음씩 만들어 두고 (사용자, 월, 데이터 버전, 페이지 커서)가 같으면 재사용
+def build_happy_cards(cards):
+    return "".join(f"""
+                <div class="happy-card">
+                    <div class="happy-date">{date} {EMOTION_META['기쁨']['emoji']}</div>
+                    <div class="happy-text">{text}</div>
+                </div>
+                """ for date, text in cards)
 
+@instrument("page_happy_storage")
 def page_happy_storage(sh):
     st.markdown("## 📂 행복 저장소")
     
@@ -705,54 +2045,76 @@ def page_happy_storage(sh):
     text_color = "#555" if not st.session_state.dark_mode else "#bbbbbb"
     st.markdown(f"<p style='color:{text_color}; font-size:1.5rem;'>다시 찾아올 당신의 봄날을 위해, 행복했던 기억들을 미리 꺼내두었어요. 🥰</p>", unsafe_allow_html=True)
     
-    # 데이터 가져오기 및 '기쁨' 필터링
-    my_diaries = get_user_diaries(sh, st.session_state.username)
-    happy_moments = {date: data for date, data in my_diaries.items() if data['emotion'] == '기쁨'}
+    # ⭐️ '기쁨' 기록이 있는 월 목록만 가져오고, 카드는 선택한 월에서 페이지 단위로 불러옴
+    # (시트 동기화는 이번 달과 선택한 달의 파티션만)
+    username = st.session_state.username
+    ensure_local_store(sh, username=username, months=[datetime.now(KST).strftime("%Y-%m")])
+    happy_months = store_emotion_months(username, '기쁨')
+    if get_backfill_state()["running"]: st.caption("⏳ 지난 기록을 불러오는 중이에요. 잠시 후 더 많은 순간이 보일 수 있어요.")
     
-    if not happy_moments:
+    if not happy_months:
         st.info("아직 기록된 기쁨의 순간이 없어요.")
-    else:
-        # 월별 필터를 위한 선택창
-        dates_all = sorted(happy_moments.keys(), reverse=True)
-        years = sorted(list(set([d.split("-")[0] for d in dates_all])), reverse=True)
-        
-        c1, c2 = st.columns([0.3, 0.7])
-        with c1:
-            sel_year = st.selectbox("연도 선택", years, key="happy_sel_year")
-            months = sorted(list(set([d.split("-")[1] for d in dates_all if d.startswith(sel_year)])), reverse=True)
-            sel_month = st.selectbox("월 선택", months, key="happy_sel_month")
-            
-        target_prefix = f"{sel_year}-{sel_month}"
-        filtered_dates = [d for d in dates_all if d.startswith(target_prefix)]
-        
-        st.write("") # 간격
-        
-        if not filtered_dates:
-            st.warning(f"{sel_year}년 {sel_month}월에는 기쁨의 기록이 없네요.")
-        else:
-            # 한 줄에 하나씩(Full Width) 출력
-            for date in filtered_dates:
-                data = happy_moments[date]
-                st.markdown(f"""
-                <div class="happy-card">
-                    <div class="happy-date">{date} {EMOTION_META['기쁨']['emoji']}</div>
-                    <div class="happy-text">{data['text']}</div>
-                </div>
-                """, unsafe_allow_html=True)
+    else: happy_card_list(sh, username, happy_months)
 
     st.divider()
     b1, b2 = st.columns(2)
     with b1:
-        if st.button("📅 달력 보기", use_container_width=True, key="happy_cal"): 
-            st.session_state.page = "dashboard"
-            st.rerun()
+        st.button("📅 달력 보기", use_container_width=True, key="happy_cal", on_click=navigate, args=("happy_cal", "dashboard"))
     with b2:
-        if st.button("📊 통계 보러가기", use_container_width=True, key="happy_stats"): 
-            st.session_state.page = "stats"
-            st.rerun()
+        st.button("📊 통계 보러가기", use_container_width=True, key="happy_stats", on_click=navigate, args=("happy_stats", "stats"))
+
+# ⭐️ 연/월 선택과 '더 보기'는 카드 목록 조각만 다시 실행
+@st_fragment
+def happy_card_list(sh, username, happy_months):
+    record_fragment_run()
+    # 월별 필터를 위한 선택창
+    years = sorted({ym[:4] for ym in happy_months}, reverse=True)
+    
+    c1, c2 = st.columns([0.3, 0.7])
+    with c1:
+        sel_year = st.selectbox("연도 선택", years, key="happy_sel_year")
+        months = [ym[5:] for ym in happy_months if ym.startswith(sel_year)]
+        sel_month = st.selectbox("월 선택", months, key="happy_sel_month")
+        
+    target_prefix = f"{sel_year}-{sel_month}"
+    ensure_local_store(sh, username=username, months=[target_prefix])
+    # 월이 바뀌거나 그 달 일기가 바뀌면 첫 페이지부터 (불러온 카드는 '더 보기'를 누른 만큼만 유지)
+    view_key = (username, target_prefix, store_month_version(username, target_prefix))
+    view = st.session_state.get("happy_view")
+    if not view or view["key"] != view_key:
+        page = store_emotion_page(username, '기쁨', target_prefix)
+        view = {"key": view_key, "cards": page, "done": len(page) < HAPPY_PAGE_SIZE}
+        st.session_state.happy_view = view
+    
+    st.write("") # 간격
+    
+    if not view["cards"]:
+        st.warning(f"{sel_year}년 {sel_month}월에는 기쁨의 기록이 없네요.")
+    else:
+        # 한 줄에 하나씩(Full Width) 출력
+        # 페이지 묶음마다 (커서 = 앞 페이지의 마지막 날짜) 한 번만 만들어 두고 이어 붙임 ('더 보기'가 앞 카드를 다시 복사하지 않도록)
+        cards = view["cards"]
+        chunks = [cached_fragment("happy_cards", (view_key, cards[i - 1][0] if i else None),
+                                  lambda i=i: build_happy_cards(cards[i:i + HAPPY_PAGE_SIZE]))
+                  for i in range(0, len(cards), HAPPY_PAGE_SIZE)]
+        st.markdown("".join(chunks), unsafe_allow_html=True)
+        if not view["done"]:
+            st.button("⬇️ 더 보기", use_container_width=True, key="happy_more", on_click=load_more_happy, args=(username, target_prefix))
 
 # --- 메인 실행 로직 ---
-if st.session_state.logged_in: main_app()
-elif st.session_state.page == "intro": intro_page()
-else: login_page()
+# (streamlit run 으로 실행될 때만 화면을 그림 — 벤치마크 등 CLI 도구는 함수만 import)
+if __name__ == "__main__":
+    start_model_warmup()  # 프로세스당 1회, 백그라운드에서 모델 로드 시작
+    start_metrics_exporter()
+    # 이번 실행을 일으킨 상호작용을 꺼내 셈
+    record_script_run(st.session_state.pop("interaction", None))
+    apply_custom_css()
+
+    if "logged_in" not in st.session_state: st.session_state.logged_in = False
+    if "page" not in st.session_state: st.session_state.page = "intro" 
+    if "dark_mode" not in st.session_state: st.session_state.dark_mode = False
+
+    if st.session_state.logged_in: main_app()
+    elif st.session_state.page == "intro": intro_page()
+    else: login_page()
 
@@ -0,0 +1,304 @@
+# --- MOODIARY 성능 벤치마크 ---
+# 사용법:
+#   python moodiary_bench.py long-text      # 긴 일기: 잘라내기 vs 청크 추론 (지연 시간 / 정확도)
+#   python moodiary_bench.py throughput     # 1건씩 추론 vs 마이크로 배치 워커 처리량
+#   python moodiary_bench.py backends       # fp32 / int8 / onnx 정확도 일치율, 지연 시간, 메모리
+#   python moodiary_bench.py offline --save-baseline   # 가짜 시트/Spotify/TMDB 로 시나리오 실행 후 기준선 저장
+#   python moodiary_bench.py offline        # 같은 시나리오를 돌려 저장된 기준선과 비교 (회귀 시 종료 코드 1)
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import moodiary_app as app
+import moodiary_fakes as fakes
+
+# 고정 샘플 (앞부분은 평범한 하루, 감정은 뒤쪽에 나오도록 구성)
+NEUTRAL_FILLER = "오늘은 아침에 일어나서 밥을 먹고 버스를 타고 학교에 갔다. 수업을 듣고 친구들과 점심을 먹었다. "
+LATE_EMOTION_SAMPLES = [
+    ("기쁨", "그런데 저녁에 합격 소식을 들었다! 너무 기뻐서 소리를 질렀고 하루 종일 웃음이 멈추지 않았다."),
+    ("슬픔", "집에 오는 길에 키우던 강아지가 무지개다리를 건넜다는 연락을 받았다. 눈물이 멈추지 않는다."),
+    ("분노", "그런데 누가 내 물건을 말도 없이 가져가서 망가뜨려 놓았다. 정말 화가 나서 참을 수가 없다."),
+    ("불안", "내일 발표가 있는데 준비가 하나도 안 됐다. 실수할까 봐 가슴이 두근거리고 잠이 오지 않는다."),
+]
+SHORT_SAMPLES = [
+    "오늘 친구랑 맛있는 거 먹어서 너무 행복했어!",
+    "시험을 망쳐서 속상하고 눈물이 난다.",
+    "버스를 놓쳐서 지각했다. 정말 짜증난다.",
+    "별일 없이 평범하게 지나간 하루였다.",
+    "할 일이 너무 많아서 지치고 힘들다.",
+    "내일 면접인데 떨려서 아무것도 손에 안 잡힌다.",
+]
+
+
+def long_text(target_chars, ending):
+    body = NEUTRAL_FILLER * (target_chars // len(NEUTRAL_FILLER) + 1)
+    return body[:max(0, target_chars - len(ending))] + ending
+
+
+def percentiles(samples_ms):
+    xs = sorted(samples_ms)
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    return {"p50": round(pick(0.50), 1), "p95": round(pick(0.95), 1), "p99": round(pick(0.99), 1),
+            "mean": round(statistics.mean(xs), 1)}
+
+
+def load_bundle(backend=None):
+    bundle = app.load_emotion_model(backend)
+    if bundle[0] is None: raise SystemExit(f"모델 로드 실패 ({backend or app.INFERENCE_BACKEND})")
+    return bundle
+
+
+# 현재 프로세스 상주 메모리 (MB, 리눅스 /proc 기준)
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"): return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def bench_long_text(args):
+    bundle = load_bundle()
+    modes = [("truncate", False, None)] + [(f"chunk-{a}", True, a) for a in ("mean", "max", "weighted")]
+    report = {}
+    for name, chunking, agg in modes:
+        latencies, correct = [], 0
+        for expected, ending in LATE_EMOTION_SAMPLES:
+            text = long_text(args.chars, ending)
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                label, _ = app.analyze_diary_batch([text], *bundle, chunking=chunking, aggregation=agg)[0]
+                latencies.append((time.perf_counter() - t0) * 1000)
+            correct += label == expected
+        pct = percentiles(latencies)
+        report[name] = {**pct, "late_emotion_accuracy": f"{correct}/{len(LATE_EMOTION_SAMPLES)}",
+                        "within_budget": pct["p95"] <= app.INFER_LATENCY_BUDGET_MS}
+    return {"chars": args.chars, "budget_ms": app.INFER_LATENCY_BUDGET_MS, "modes": report}
+
+
+def bench_throughput(args):
+    bundle = load_bundle()
+    # 결과 캐시가 배치 효과를 가리지 않도록: 요청마다 다른 문장 + 디스크 캐시 끔 + 빈 LRU에서 시작
+    texts = [f"{SHORT_SAMPLES[i % len(SHORT_SAMPLES)]} ({i})" for i in range(args.requests)]
+    app.EMOTION_CACHE_PERSIST = False
+    app.get_emotion_cache.clear()
+    # 기준: 요청마다 forward pass 1회
+    t0 = time.perf_counter()
+    for t in texts: app.analyze_diary_batch([t], *bundle)
+    single = time.perf_counter() - t0
+    # 마이크로 배치: 동시 세션이 analyze_diary를 호출
+    app.analyze_diary("워커 기동", *bundle)
+    worker = app.get_inference_worker(*bundle)
+    b0, i0 = worker["batches"], worker["items"]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex: list(ex.map(lambda t: app.analyze_diary(t, *bundle), texts))
+    batched = time.perf_counter() - t0
+    batches = worker["batches"] - b0
+    return {"requests": args.requests, "concurrency": args.concurrency,
+            "single_rps": round(args.requests / single, 1), "batched_rps": round(args.requests / batched, 1),
+            "speedup": round(single / batched, 2), "avg_batch_size": round((worker["items"] - i0) / max(batches, 1), 1),
+            "cache_hits": app.emotion_cache_stats()["hits"]}
+
+
+def bench_backends(args):
+    samples = SHORT_SAMPLES + [long_text(1000, ending) for _, ending in LATE_EMOTION_SAMPLES]
+    report, reference = {}, None
+    for backend in args.backends:
+        if backend == "onnx" and not app.ORT_AVAILABLE:
+            report[backend] = {"skipped": "onnxruntime 미설치"}; continue
+        before = rss_mb()
+        bundle = load_bundle(backend)
+        loaded = rss_mb()
+        preds = app.analyze_diary_batch(samples, *bundle)  # 예열 겸 정확도 비교용
+        latencies = []
+        for _ in range(args.repeat):
+            for text in samples:
+                t0 = time.perf_counter()
+                app.analyze_diary_batch([text], *bundle)
+                latencies.append((time.perf_counter() - t0) * 1000)
+        entry = {**percentiles(latencies), "load_mb": round(loaded - before, 1), "peak_rss_mb": round(rss_mb(), 1)}
+        if reference is None: reference = preds
+        entry["label_agreement"] = round(sum(a[0] == b[0] for a, b in zip(preds, reference)) / len(samples), 3)
+        entry["max_score_diff"] = round(max(abs(a[1] - b[1]) for a, b in zip(preds, reference)), 4)
+        report[backend] = entry
+    failed = [b for b, e in report.items() if e.get("label_agreement", 1.0) < args.min_agreement]
+    return {"reference": args.backends[0], "samples": len(samples), "backends": report, "parity_failed": failed}
+
+
+# =========================================
+# 🧪 오프라인 시나리오 (네트워크 없이 가짜 시트 / Spotify / TMDB)
+# =========================================
+def setup_offline(args):
+    workdir = tempfile.mkdtemp(prefix="moodiary-bench-")
+    app.LOCAL_DB_PATH = os.path.join(workdir, "local.db")  # 실제 로컬 미러를 건드리지 않도록
+    app.DIARY_PARTITIONING = args.partitioning
+    sh = fakes.build_spreadsheet(args.users, args.days, latency_ms=args.sheet_latency_ms, per_row_us=args.sheet_per_row_us,
+                                 quota_per_min=args.sheet_quota, seed=args.seed, partition=app.diary_partition)
+    spotify = fakes.FakeSpotify(args.api_latency_ms, seed=args.seed)
+    tmdb = fakes.FakeTMDBSession(args.api_latency_ms, seed=args.seed)
+    # 외부 클라이언트를 이 프로세스 안에서만 대역으로 교체
+    app.get_spotify_client = lambda: spotify
+    app.get_tmdb_session = lambda: tmdb
+    app.st.secrets = {"tmdb": {"api_key": "offline"}}
+    t0 = time.perf_counter()
+    # 요청 경로(ensure_local_store)는 필요한 파티션만 맞추므로, 시작 시 전체 파티션을 한 번 동기화
+    for title in app.diary_partitions(sh, refresh=True): app.sync_diaries(sh, title)
+    return SimpleNamespace(sh=sh, spotify=spotify, tmdb=tmdb, workdir=workdir,
+                           initial_sync_ms=round((time.perf_counter() - t0) * 1000, 1))
+
+
+def run_timed(fn, items, concurrency):
+    def timed(item):
+        t0 = time.perf_counter()
+        fn(item)
+        return (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex: latencies = list(ex.map(timed, items))
+    wall = time.perf_counter() - t0
+    return {"requests": len(items), "rps": round(len(items) / wall, 1), **percentiles(latencies)}
+
+
+def calls_since(backend, before):
+    after = backend.stats()
+    metadata = lambda stats: sum(stats["calls"].get(k, 0) for k in ("worksheet", "worksheets"))
+    return {"api_calls": after["total"] - before["total"], "metadata_calls": metadata(after) - metadata(before),
+            "throttled": after["throttled"] - before["throttled"]}
+
+
+# 동시 로그인: 인덱스가 비어 있는 상태에서 시작, 10%는 없는 아이디
+def scenario_login_storm(env, args, rng):
+    idx = app.get_user_index()
+    with idx["lock"]: idx["users"], idx["loaded_at"] = {}, None
+    names = [f"user{rng.randrange(args.users)}" if rng.random() < 0.9 else f"ghost{i}" for i in range(args.requests)]
+    before = env.sh.backend.stats()
+    result = run_timed(lambda u: app.lookup_user(env.sh, u), names, args.concurrency)
+    return {**result, **calls_since(env.sh.backend, before)}
+
+
+# 동시 저장: 절반은 기존 날짜 수정, 절반은 새 날짜 추가. 대기열이 시트에 모두 반영될 때까지의 시간 포함
+def scenario_save_storm(env, args, rng):
+    items = [(f"user{rng.randrange(args.users)}",
+              (f"2025-12-{rng.randint(1, 28):02d}" if i % 2 else f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"),
+              rng.choice(fakes.EMOTIONS), f"벤치마크 저장 {i}") for i in range(args.requests)]
+    before = env.sh.backend.stats()
+    result = run_timed(lambda it: app.add_diary(env.sh, *it), items, args.concurrency)
+    t0 = time.perf_counter()
+    while app.outbox_stats()["pending"] and time.perf_counter() - t0 < args.drain_timeout:
+        app.get_outbox_state()["wake"].set()
+        time.sleep(0.05)
+    return {**result, "drain_s": round(time.perf_counter() - t0, 2), "pending": app.outbox_stats()["pending"],
+            **calls_since(env.sh.backend, before)}
+
+
+# 통계/달력 탐색: 사용자별로 최근 달을 오가며 일기, 월별 집계, 달력, 행복 저장소 첫 페이지 조회
+def scenario_stats_browse(env, args, rng):
+    months = [f"2025-{m:02d}" for m in range(1, 13)]
+    def browse(item):
+        username, ym = item
+        app.get_user_diaries(env.sh, username)
+        app.store_emotion_counts(username, ym)
+        app.calendar_events(username, ym, False)
+        app.store_emotion_page(username, "기쁨", ym)
+    items = [(f"user{rng.randrange(args.users)}", rng.choice(months)) for _ in range(args.requests)]
+    before = env.sh.backend.stats()
+    result = run_timed(browse, items, args.concurrency)
+    return {**result, **calls_since(env.sh.backend, before)}
+
+
+# 추천 새로고침: 후보 풀이 빈 상태(cold)와 채워진 상태(warm)를 따로 측정
+def scenario_reco_refresh(env, args, rng):
+    registry = app.get_reco_pools()
+    with registry["lock"]: registry["pools"].clear()
+    emotions = list(app.SEARCH_KEYWORDS)
+    fetch = lambda emo: (app.recommend_music(emo), app.recommend_movies(emo))
+    before = (env.spotify.backend.stats(), env.tmdb.backend.stats())
+    cold = run_timed(fetch, emotions, len(emotions))
+    warm = run_timed(fetch, [rng.choice(emotions) for _ in range(args.requests)], args.concurrency)
+    return {"cold": cold, "warm": warm, "spotify": calls_since(env.spotify.backend, before[0]),
+            "tmdb": calls_since(env.tmdb.backend, before[1])}
+
+
+SCENARIOS = {"login-storm": scenario_login_storm, "save-storm": scenario_save_storm,
+             "stats-browse": scenario_stats_browse, "reco-refresh": scenario_reco_refresh}
+BASELINE_CONFIG_KEYS = ("users", "days", "requests", "concurrency", "partitioning", "sheet_latency_ms", "sheet_per_row_us",
+                        "sheet_quota", "api_latency_ms", "seed")
+
+
+# 기준선 대비 p95 가 커지거나 rps 가 작아지면 회귀 (1ms 미만 경로의 흔들림은 min_delta_ms 로 무시)
+def compare_baseline(current, baseline, tolerance, min_delta_ms=2.0):
+    regressions = []
+    def walk(cur, base, path):
+        for key, value in cur.items():
+            ref = base.get(key) if isinstance(base, dict) else None
+            if isinstance(value, dict): walk(value, ref, f"{path}{key}."); continue
+            if not isinstance(ref, (int, float)) or not ref: continue
+            if (key == "p95" and value > ref * (1 + tolerance) and value - ref >= min_delta_ms) or (key == "rps" and value < ref * (1 - tolerance)):
+                regressions.append(f"{path}{key}: {ref} → {value}")
+    walk(current, baseline, "")
+    return regressions
+
+
+def bench_offline(args):
+    rng = random.Random(args.seed)
+    env = setup_offline(args)
+    scenarios = {name: SCENARIOS[name](env, args, rng) for name in args.scenarios}
+    config = {k: getattr(args, k) for k in BASELINE_CONFIG_KEYS}
+    result = {"config": config, "initial_sync_ms": env.initial_sync_ms, "scenarios": scenarios}
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump({"config": config, "scenarios": scenarios}, f, ensure_ascii=False, indent=2)
+        result["baseline_saved"] = args.baseline
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+        if baseline.get("config") != config: result["baseline_skipped"] = "설정이 기준선과 달라 비교하지 않음"
+        else: result["regressions"] = compare_baseline(scenarios, baseline["scenarios"], args.tolerance, args.min_delta_ms)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MOODIARY 성능 벤치마크")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("long-text", help="긴 일기 청크 추론 벤치마크")
+    p.add_argument("--chars", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_long_text)
+    p = sub.add_parser("throughput", help="마이크로 배치 처리량 벤치마크")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.set_defaults(func=bench_throughput)
+    p = sub.add_parser("backends", help="추론 백엔드 정확도 일치율 / 지연 시간 / 메모리")
+    p.add_argument("--backends", nargs="+", default=list(app.INFERENCE_BACKENDS), choices=app.INFERENCE_BACKENDS,
+                   help="첫 번째 백엔드가 정확도 비교 기준 (기본 fp32)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--min-agreement", type=float, default=0.95)
+    p.set_defaults(func=bench_backends)
+    p = sub.add_parser("offline", help="가짜 시트/Spotify/TMDB 로 시나리오 실행, 기준선과 비교")
+    p.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--days", type=int, default=120, help="사용자당 과거 일수 (약 70%% 작성)")
+    p.add_argument("--requests", type=int, default=500, help="시나리오당 요청 수")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--partitioning", choices=app.DIARY_PARTITIONINGS, default=app.DIARY_PARTITIONING)
+    p.add_argument("--sheet-latency-ms", type=float, default=80.0, help="시트 API 호출당 지연")
+    p.add_argument("--sheet-per-row-us", type=float, default=5.0, help="읽고 쓴 행당 추가 지연")
+    p.add_argument("--sheet-quota", type=int, default=300, help="시트 API 분당 요청 한도 (0 이면 무제한)")
+    p.add_argument("--api-latency-ms", type=float, default=120.0, help="Spotify / TMDB 호출당 지연")
+    p.add_argument("--drain-timeout", type=float, default=60.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--baseline", default="bench_baseline.json")
+    p.add_argument("--save-baseline", action="store_true", help="결과를 기준선으로 저장")
+    p.add_argument("--tolerance", type=float, default=0.2, help="허용 악화 비율")
+    p.add_argument("--min-delta-ms", type=float, default=2.0, help="이보다 작은 p95 증가는 회귀로 보지 않음")
+    p.set_defaults(func=bench_offline)
+    args = parser.parse_args()
+    result = args.func(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result.get("parity_failed") or result.get("regressions"): raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# --- MOODIARY 오프라인 대역 (벤치마크용) ---
+# 네트워크 없이 앱 코드를 그대로 돌리기 위한 프로세스 내 가짜 구현입니다.
+# - FakeSpreadsheet / FakeWorksheet : gspread 의 Spreadsheet / Worksheet 중 앱이 쓰는 메서드만 (지연 시간, 행 수, 분당 할당량 설정)
+# - FakeSpotify                     : spotipy.Spotify 의 search / playlist_items
+# - FakeTMDBSession                 : requests.Session 으로 부르는 TMDB discover/movie
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from datetime import date, timedelta
+
+try: from gspread.exceptions import WorksheetNotFound
+except ImportError:
+    class WorksheetNotFound(Exception): pass
+
+EMOTIONS = ["기쁨", "슬픔", "분노", "불안", "힘듦", "중립"]
+
+
+class QuotaExceeded(Exception):
+    # gspread.exceptions.APIError(429) 대역
+    pass
+
+
+# 호출 지연 (기본 + 행당 비용)과 분당 요청 수 제한을 흉내 냄
+class _Backend:
+    def __init__(self, latency_ms=0.0, per_row_us=0.0, quota_per_min=0, jitter=0.2, seed=0):
+        self.latency_ms, self.per_row_us, self.quota_per_min, self.jitter = latency_ms, per_row_us, quota_per_min, jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.calls = Counter()
+        self.throttled = 0
+
+    def call(self, name, rows=0):
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0] > 60: self.window.popleft()
+            if self.quota_per_min and len(self.window) >= self.quota_per_min:
+                self.throttled += 1
+                raise QuotaExceeded(f"429 Quota exceeded ({self.quota_per_min}/min)")
+            self.window.append(now)
+            self.calls[name] += 1
+            delay = (self.latency_ms + rows * self.per_row_us / 1000) * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        if delay > 0: time.sleep(delay / 1000)
+
+    def stats(self):
+        with self.lock: return {"calls": dict(self.calls), "total": sum(self.calls.values()), "throttled": self.throttled}
+
+
+class FakeWorksheet:
+    def __init__(self, backend, title, header, rows=None):
+        self.backend, self.title, self.header = backend, title, list(header)
+        self.rows = [list(r) for r in rows or []]
+        self.lock = threading.Lock()
+
+    def _padded(self, r):
+        return (list(r) + [""] * len(self.header))[:len(self.header)]
+
+    def get_all_records(self):
+        with self.lock: rows = [self._padded(r) for r in self.rows]
+        self.backend.call("get_all_records", len(rows))
+        return [dict(zip(self.header, r)) for r in rows]
+
+    def get_all_values(self):
+        with self.lock: rows = [self.header] + [list(r) for r in self.rows]
+        self.backend.call("get_all_values", len(rows))
+        return rows
+
+    def row_values(self, row):
+        self.backend.call("row_values", 1)
+        with self.lock: return list(([self.header] + self.rows)[row - 1]) if 0 < row <= len(self.rows) + 1 else []
+
+    # "A2:D" / "A2:D100" / "diaries!A2:D100" 형태만 지원
+    def get(self, rng, **kwargs):
+        m = re.fullmatch(r"(?:[^!]*!)?([A-Z]+)(\d+):([A-Z]+)(\d*)", rng)
+        if not m: raise ValueError(f"지원하지 않는 범위: {rng}")
+        c0, c1 = ord(m.group(1)) - 65, ord(m.group(3)) - 64
+        first, last = int(m.group(2)), int(m.group(4)) if m.group(4) else None
+        with self.lock:
+            allrows = [self.header] + self.rows
+            values = [list(r[c0:c1]) for r in allrows[first - 1:last]]
+        self.backend.call("get", len(values))
+        return values
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self.backend.call("append_rows", len(values))
+        with self.lock:
+            # 새로 만든 빈 워크시트에 처음 추가한 행은 헤더
+            if not self.header and values: self.header, values = list(values[0]), values[1:]
+            start = len(self.rows) + 2
+            self.rows.extend(list(v) for v in values)
+            end = len(self.rows) + 1
+        return {"updates": {"updatedRange": f"{self.title}!A{start}:{chr(64 + len(self.header))}{end}"}}
+
+    def batch_update(self, data, **kwargs):
+        self.backend.call("batch_update", len(data))
+        with self.lock:
+            for item in data:
+                m = re.fullmatch(r"(?:[^!]*!)?([A-Z]+)(\d+)(?::[A-Z]+\d+)?", item["range"])
+                col, row = ord(m.group(1)) - 65, int(m.group(2))
+                target = self.rows[row - 2]
+                for j, v in enumerate(item["values"][0]):
+                    while len(target) <= col + j: target.append("")
+                    target[col + j] = v
+        return {"totalUpdatedCells": sum(len(item["values"][0]) for item in data)}
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend=None, title="MOODIARY"):
+        self.backend = backend or _Backend()
+        self.title = title
+        self.sheets = {}
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        self.backend.call("add_worksheet")
+        ws = self.sheets[title] = FakeWorksheet(self.backend, title, [])
+        return ws
+
+    # gspread 의 worksheet() 도 메타데이터 조회 1회(= API 호출 1회)
+    def worksheet(self, title):
+        self.backend.call("worksheet")
+        if title not in self.sheets: raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.backend.call("worksheets")
+        return list(self.sheets.values())
+
+
+# 사용자 n_users 명, 사용자당 최근 days 일 중 fill 비율만큼 작성한 시트. partition(username, date) → 워크시트 이름
+def build_spreadsheet(n_users=200, days=120, fill=0.7, latency_ms=0.0, per_row_us=0.0, quota_per_min=0, seed=0,
+                      partition=lambda username, date: "diaries"):
+    rng = random.Random(seed)
+    backend = _Backend(latency_ms, per_row_us, quota_per_min, seed=seed)
+    sh = FakeSpreadsheet(backend)
+    users = [f"user{i}" for i in range(n_users)]
+    today = date(2025, 12, 31)
+    diaries = [[u, (today - timedelta(days=d)).isoformat(), rng.choice(EMOTIONS), f"{u}의 {d}일 전 일기입니다."]
+               for u in users for d in range(days) if rng.random() < fill]
+    sh.sheets["users"] = FakeWorksheet(backend, "users", ["username", "password"], [[u, "1234"] for u in users])
+    for row in diaries:
+        title = partition(row[0], row[1])
+        if title not in sh.sheets: sh.sheets[title] = FakeWorksheet(backend, title, ["username", "date", "emotion", "text"])
+        sh.sheets[title].rows.append(row)
+    return sh
+
+
+class FakeSpotify:
+    def __init__(self, latency_ms=0.0, playlists_per_search=10, tracks_per_playlist=30, seed=0):
+        self.backend = _Backend(latency_ms, seed=seed)
+        self.playlists_per_search, self.tracks_per_playlist = playlists_per_search, tracks_per_playlist
+
+    def search(self, q, type="track", limit=10, market=None, **kwargs):
+        self.backend.call("search")
+        key = zlib.crc32(q.encode()) % 10_000
+        return {"playlists": {"items": [{"id": f"pl{key}-{i}", "name": f"{q} #{i}"}
+                                        for i in range(min(limit, self.playlists_per_search))]}}
+
+    def playlist_items(self, playlist_id, limit=100, **kwargs):
+        self.backend.call("playlist_items")
+        # 재생목록끼리 일부 곡이 겹치도록 구성 (중복 제거 경로 확인용)
+        return {"items": [{"track": {"id": f"{playlist_id.split('-')[0] if i % 2 else playlist_id}-t{i}", "name": f"Track {i}"}}
+                          for i in range(min(limit, self.tracks_per_playlist))]}
+
+
+class _FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload, self.status_code = payload, status_code
+
+    def json(self):
+        return self.payload
+
+
+class FakeTMDBSession:
+    def __init__(self, latency_ms=0.0, per_page=20, seed=0):
+        self.backend = _Backend(latency_ms, seed=seed)
+        self.per_page = per_page
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        self.backend.call("discover")
+        params = params or {}
+        genres, page = params.get("with_genres", ""), int(params.get("page", 1))
+        rng = random.Random(f"{genres}:{page}")
+        return _FakeResponse({"page": page, "results": [
+            {"id": page * 1000 + i, "title": f"영화 {genres} {page}-{i}", "release_date": f"{rng.randint(2000, 2024)}-01-01",
+             "vote_average": round(rng.uniform(6.5, 9.0), 1), "vote_count": rng.randint(300, 20000),
+             "overview": "줄거리", "poster_path": f"/p{page}{i}.jpg"}
+            for i in range(self.per_page)]})
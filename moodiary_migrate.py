@@ -0,0 +1,65 @@
+# --- MOODIARY 일기 워크시트 파티션 이전 ---
+# 기존 워크시트(기본: diaries 하나)의 행을 새 파티션 방식의 워크시트들로 복사합니다.
+# - 대상 워크시트가 없으면 만들고, 이미 옮겨진 (username, date) 는 건너뛰므로 중단 후 같은 명령으로 재실행하면 됩니다.
+# - 원본 워크시트는 지우지 않습니다. 복사가 끝나면 MOODIARY_PARTITIONING 을 새 방식으로 바꿔 앱을 재시작하세요.
+#   (로컬 미러는 첫 동기화 때 파티션 방식이 바뀐 것을 보고 파티션별 전체 대조로 다시 맞춥니다)
+# 사용법:
+#   python moodiary_migrate.py --to month --dry-run          # 파티션별 행 수만 확인
+#   python moodiary_migrate.py --to user_hash                # 실제 복사
+#   python moodiary_migrate.py --from month --to user_hash   # 파티션 방식 간 이전
+import argparse
+import time
+
+import moodiary_app as app
+
+
+def read_source(sh, mode):
+    rows = {}
+    titles = sorted(t for t in app.worksheet_titles(sh, 0) if app.is_diary_partition(t, mode))
+    for title in titles:
+        values = app._sheet_values(app.get_worksheet(sh, title).get("A2:D"))
+        # 같은 (사용자, 날짜)가 여러 번 있으면 아래쪽(나중) 행이 우선
+        for u, d, e, t in values:
+            if u and d: rows[(u, d)] = [u, d, e, t]
+        print(f"{title}: {len(values):,}행 읽음")
+    return titles, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="일기 워크시트 파티션 이전")
+    parser.add_argument("--from", dest="source", choices=app.DIARY_PARTITIONINGS, default="none")
+    parser.add_argument("--to", dest="target", choices=app.DIARY_PARTITIONINGS, required=True)
+    parser.add_argument("--chunk", type=int, default=5000, help="append_rows 한 번에 쓰는 행 수")
+    parser.add_argument("--pause", type=float, default=1.0, help="쓰기 요청 사이 대기 (초, 분당 할당량 대비)")
+    parser.add_argument("--dry-run", action="store_true", help="시트에 쓰지 않고 파티션별 행 수만 출력")
+    args = parser.parse_args()
+    if args.source == args.target: raise SystemExit("--from 과 --to 가 같습니다.")
+
+    sh = app.init_db()
+    if sh is None: raise SystemExit("DB 연결 실패 (.streamlit/secrets.toml 확인)")
+    _, rows = read_source(sh, args.source)
+    partitions = {}
+    for (u, d), row in sorted(rows.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        partitions.setdefault(app.diary_partition(u, d, args.target), []).append(row)
+    print(f"원본 {len(rows):,}건 → {args.target} 파티션 {len(partitions)}개")
+
+    existing = set(app.worksheet_titles(sh))
+    copied = 0
+    for title, group in sorted(partitions.items()):
+        if title in existing:
+            ws = app.get_worksheet(sh, title)
+            done = {(u, d) for u, d, _, _ in app._sheet_values(ws.get("A2:D"))}
+            group = [r for r in group if (r[0], r[1]) not in done]
+        elif not args.dry_run: ws = app.get_diary_worksheet(sh, title, create=True)
+        print(f"{title}: {len(group):,}행 {'복사 예정' if args.dry_run else '복사'}")
+        if args.dry_run: continue
+        for i in range(0, len(group), args.chunk):
+            ws.append_rows(group[i:i + args.chunk])
+            copied += len(group[i:i + args.chunk])
+            time.sleep(args.pause)
+    if args.dry_run: return
+    print(f"완료: {copied:,}행 복사. MOODIARY_PARTITIONING={args.target} 로 앱을 재시작하세요.")
+
+
+if __name__ == "__main__":
+    main()
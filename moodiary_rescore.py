@@ -0,0 +1,133 @@
+# --- MOODIARY 감정 일괄 재채점 ---
+# EMOTION_MODEL_ID 가 바뀐 뒤, 과거 일기의 emotion 값을 새 모델로 다시 계산해 시트에 반영합니다.
+# - diaries 행을 페이지 단위로 읽어 오고 (스트리밍)
+# - CPU 코어 수만큼의 프로세스 풀에서 큰 패딩 배치로 추론하고
+# - 페이지마다 바뀐 라벨을 batch_update 한 번으로 쓰고, 체크포인트를 남겨 중단 후 이어서 실행합니다.
+# - 일기 워크시트가 파티션으로 나뉘어 있으면(MOODIARY_PARTITIONING) 파티션마다 차례로 처리합니다.
+# 사용법:
+#   python moodiary_rescore.py --dry-run                 # 시트는 그대로 두고 변경 내역(diff)만 기록
+#   python moodiary_rescore.py --workers 8 --page 5000   # 실제 반영 (중단되면 같은 명령으로 재개)
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import time
+
+import moodiary_app as app
+
+_BUNDLE = None
+
+
+# =========================================
+# 🧠 워커 프로세스 (프로세스마다 모델 1개)
+# =========================================
+def _init_worker(backend, threads):
+    global _BUNDLE
+    import torch
+    torch.set_num_threads(threads)
+    _BUNDLE = app.load_emotion_model(backend)
+    if _BUNDLE[0] is None: raise RuntimeError("모델 로드 실패")
+
+
+def _score(batch):
+    rows, texts = zip(*batch)
+    return [(row, label, score) for row, (label, score) in zip(rows, app.analyze_diary_batch(texts, *_BUNDLE))]
+
+
+# =========================================
+# 📥 시트 스트리밍 / 체크포인트
+# =========================================
+def iter_pages(ws, start_row, page_size):
+    row = start_row
+    while True:
+        values = ws.get(f"A{row}:D{row + page_size - 1}")
+        if not values: return
+        yield row, [(row + i, (v + [""] * 4)[:4]) for i, v in enumerate(values)]
+        if len(values) < page_size: return
+        row += page_size
+
+
+def iter_partition_pages(sh, state, page_size):
+    for title in app.diary_partitions(sh, refresh=True):
+        ws = app.get_worksheet(sh, title)
+        for page_start, rows in iter_pages(ws, state["next_rows"].get(title, 2), page_size):
+            yield title, ws, page_start, rows
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path): return {"model": app.EMOTION_MODEL_ID, "next_rows": {}, "scanned": 0, "changed": 0}
+    with open(path, encoding="utf-8") as f: state = json.load(f)
+    if state.get("model") != app.EMOTION_MODEL_ID:
+        raise SystemExit(f"체크포인트 모델({state.get('model')})이 현재 모델과 다릅니다. --reset 으로 새로 시작하세요.")
+    # 파티션 도입 전 체크포인트는 diaries 하나의 진행 위치
+    if "next_rows" not in state: state["next_rows"] = {"diaries": state.pop("next_row", 2)}
+    return state
+
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="과거 일기 감정 재채점")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=64, help="워커 1회 추론 배치 크기")
+    parser.add_argument("--page", type=int, default=5000, help="시트에서 한 번에 읽고 쓰는 행 수")
+    parser.add_argument("--backend", choices=app.INFERENCE_BACKENDS, default=app.INFERENCE_BACKEND)
+    parser.add_argument("--checkpoint", default="rescore_checkpoint.json")
+    parser.add_argument("--report", default="rescore_diff.csv")
+    parser.add_argument("--dry-run", action="store_true", help="시트에 쓰지 않고 diff만 기록")
+    parser.add_argument("--update-local", action="store_true", help="로컬 미러(SQLite)의 감정 값도 함께 갱신")
+    parser.add_argument("--reset", action="store_true", help="체크포인트/리포트를 지우고 처음부터")
+    args = parser.parse_args()
+    # 시트는 그대로인데 로컬만 바뀌면 다음 전체 대조에서 조용히 되돌아감
+    if args.dry_run and args.update_local: parser.error("--dry-run 과 --update-local 은 함께 쓸 수 없습니다.")
+
+    if args.reset:
+        for path in (args.checkpoint, args.report):
+            if os.path.exists(path): os.remove(path)
+    state = load_checkpoint(args.checkpoint)
+    sh = app.init_db()
+    if sh is None: raise SystemExit("DB 연결 실패 (.streamlit/secrets.toml 확인)")
+
+    new_report = not os.path.exists(args.report)
+    started, scanned_now = time.perf_counter(), 0
+    with open(args.report, "a", newline="", encoding="utf-8-sig") as rf, \
+         mp.Pool(args.workers, initializer=_init_worker, initargs=(args.backend, args.threads_per_worker)) as pool:
+        report = csv.writer(rf)
+        if new_report: report.writerow(["row", "username", "date", "old_emotion", "new_emotion", "score", "sheet"])
+        for title, ws, page_start, rows in iter_partition_pages(sh, state, args.page):
+            meta = {row: values for row, values in rows}
+            items = [(row, values[3]) for row, values in rows if values[3].strip()]
+            batches = [items[i:i + args.batch_size] for i in range(0, len(items), args.batch_size)]
+            changes = []
+            for scored in pool.imap_unordered(_score, batches):
+                for row, label, score in scored:
+                    username, date, old, _ = meta[row]
+                    if label != old: changes.append((row, username, date, old, label, round(score, 4), title))
+            changes.sort()
+            # ⭐️ 페이지의 변경분을 batch_update 한 번으로 반영 (emotion 열 위치는 헤더 기준)
+            if changes and not args.dry_run:
+                col = app.worksheet_columns(sh, title)["emotion"]
+                ws.batch_update([{"range": f"{col}{row}", "values": [[label]]} for row, _, _, _, label, _, _ in changes])
+            # 로컬 미러는 감정 값만 고침 (저장 대기 중인 항목은 앱의 새 본문이 우선이므로 건드리지 않음)
+            if changes and args.update_local:
+                pending = {(u, d) for u, d, _, _, _ in app.outbox_peek(None)}
+                app.store_set_emotions([(u, d, label) for _, u, d, _, label, _, _ in changes if (u, d) not in pending])
+            report.writerows(changes)
+            rf.flush()
+            state["next_rows"][title] = page_start + len(rows)
+            state.update(scanned=state["scanned"] + len(rows), changed=state["changed"] + len(changes))
+            save_checkpoint(args.checkpoint, state)
+            scanned_now += len(rows)
+            rate = scanned_now / max(time.perf_counter() - started, 1e-9)
+            print(f"{title} ~{page_start + len(rows) - 1}행: 누적 {state['scanned']:,}행, 변경 {state['changed']:,}건 ({rate:,.0f}행/s)")
+    print(f"완료. 변경 내역: {args.report}")
+
+
+if __name__ == "__main__":
+    main()